@@ -1,14 +1,25 @@
 import os
 import time
 import base64
+import orjson
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request
 from flask_cors import CORS
 import torch
 
+# Intra-op threads are left at torch's default (all cores) unless overridden; with several
+# gunicorn workers, gunicorn.conf.py's post_fork splits the cores between them
+if os.getenv("TORCH_NUM_THREADS"):
+    torch.set_num_threads(int(os.getenv("TORCH_NUM_THREADS")))
+# Input shapes come from a small set of letterbox/resize sizes, so let cudnn autotune per shape
+torch.backends.cudnn.benchmark = torch.cuda.is_available()
+
 from models.yolov5_detector import YOLOv5Detector
 from models.detr_detector import DETRDetector
+from batching import MicroBatcher
+from request_options import parse_bool
 
 app = Flask(__name__)
 CORS(app)
@@ -18,26 +29,117 @@ PROJECT_ROOT = r"C:\Users\palan\OneDrive\Desktop\DL_Transformer_project"
 YOLO_PATH = os.path.join(PROJECT_ROOT, "yolov5su.pt")
 # If a custom DETR was saved, use it, otherwise use pretrained
 DETR_PATH = "facebook/detr-resnet-50" 
+# TensorRT engines from core/ml/export_tensorrt.py; used on CUDA hosts when present
+YOLO_ENGINE_PATH = os.path.join(PROJECT_ROOT, "yolov5su_int8.engine")
+# YOLO engine with NMS fused in (EfficientNMS_TRT), used for requests at the default IoU
+YOLO_NMS_ENGINE_PATH = os.path.join(PROJECT_ROOT, "yolov5su_nms_fp16.engine")
+DETR_ENGINE_PATH = os.path.join(PROJECT_ROOT, "detr_fp16.engine")
+# Without a usable DETR engine, an FP16 plan is built from this ONNX export and cached per GPU
+DETR_ONNX_PATH = os.path.join(PROJECT_ROOT, "detr.onnx")
+# CPU-only hosts run this dynamic-INT8 export with ONNX Runtime (core/ml/export_detr.py)
+DETR_ONNX_INT8_PATH = os.path.join(PROJECT_ROOT, "detr_int8.onnx")
+# Opt-in: torch.compile the PyTorch models at load time (slower startup, faster steady state)
+# YOLO runtime: auto (INT8 engine if present, else .pt), trt / onnx (export next to the
+# .pt once and reuse it), or pt to force eager PyTorch
+YOLO_BACKEND = os.getenv("VF_YOLO_BACKEND", "auto").lower()
+TORCH_COMPILE = os.getenv("TORCH_COMPILE", "false").lower() == "true"
+# Opt-in: replay the eager YOLO/DETR forwards from per-shape CUDA graphs
+CUDA_GRAPHS = os.getenv("CUDA_GRAPHS", "false").lower() == "true"
+# Half-precision PyTorch inference on CUDA (fp16 for YOLO, bf16/fp16 autocast for DETR)
+FORCE_FP16 = os.getenv("FORCE_FP16", "false").lower() == "true"
+
+# Concurrent requests are coalesced into one forward pass per model; DETR is the memory hog
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", 8))
+DETR_MAX_BATCH_SIZE = int(os.getenv("DETR_MAX_BATCH_SIZE", 4))
+MAX_BATCH_DELAY_MS = float(os.getenv("MAX_BATCH_DELAY_MS", 5))
+
+# Both detectors downscale to <=1333px internally, so uploads are decoded no larger
+# than needed. JPEG draft() does the reduction inside libjpeg at DCT scale.
+DECODE_SIZE = (1280, 1280)
+# b64decode and libjpeg both release the GIL, so decodes overlap with inference
+decode_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="decode")
 
 print("📦 Initializing Detectors...")
 yolo_detector = None
 detr_detector = None
 
 try:
-    yolo_detector = YOLOv5Detector(YOLO_PATH)
+    yolo_detector = YOLOv5Detector(YOLO_PATH, engine_path=YOLO_ENGINE_PATH, compile_model=TORCH_COMPILE,
+                                   cuda_graphs=CUDA_GRAPHS, half=FORCE_FP16,
+                                   nms_engine_path=YOLO_NMS_ENGINE_PATH,
+                                   runtime=YOLO_BACKEND, export_batch=MAX_BATCH_SIZE)
 except Exception as e:
     print(f"⚠️ Failed to load YOLOv5: {e}")
 
 try:
-    detr_detector = DETRDetector(DETR_PATH)
+    detr_detector = DETRDetector(DETR_PATH, engine_path=DETR_ENGINE_PATH, onnx_path=DETR_ONNX_PATH,
+                                 onnx_int8_path=DETR_ONNX_INT8_PATH, trt_max_batch=DETR_MAX_BATCH_SIZE,
+                                 compile_model=TORCH_COMPILE, cuda_graphs=CUDA_GRAPHS, half=FORCE_FP16)
+    detr_detector.load_model()
 except Exception as e:
     print(f"⚠️ Failed to load DETR: {e}")
+    detr_detector = None
+
+# Grad mode is thread-local, so inference_mode goes on the batch fns that the batcher
+# workers run, not around the request-thread calls
+yolo_batcher = MicroBatcher(torch.inference_mode()(yolo_detector.detect_batch), MAX_BATCH_SIZE, MAX_BATCH_DELAY_MS, "yolov5") if yolo_detector else None
+detr_batcher = MicroBatcher(torch.inference_mode()(detr_detector.detect_batch), DETR_MAX_BATCH_SIZE, MAX_BATCH_DELAY_MS, "detr") if detr_detector else None
+
+def decode_image(data_uri):
+    """Decode a base64 upload at reduced resolution. Returns (image, (scale_x, scale_y)).
+
+    draft() only shrinks by powers of two while the image stays >= DECODE_SIZE, so only uploads
+    past ~2560 px come back smaller. For those, the annotated ``image_with_boxes`` is returned
+    at the decoded size (kept small on purpose: no re-encode at full resolution) while ``bbox``
+    values are mapped back to upload pixels; ``image_with_boxes_size`` says which size it is.
+    """
+    header, encoded = data_uri.split(",", 1) if "," in data_uri else (None, data_uri)
+    image = Image.open(BytesIO(base64.b64decode(encoded)))
+    orig_w, orig_h = image.size
+    image.draft("RGB", DECODE_SIZE)
+    image = image.convert("RGB")
+    return image, (orig_w / image.width, orig_h / image.height)
+
+def submit_timed(batcher, *args):
+    """Submit to a batcher and stamp the future with its own completion time.
+
+    Returns (future, start). Each model is timed from its submit to its own completion, so
+    in "both" mode DETR's time doesn't include waiting on / drawing YOLO's result.
+    """
+    start = time.perf_counter()
+    future = batcher.submit(*args)
+    future.add_done_callback(lambda f: setattr(f, "done_at", time.perf_counter()))
+    return future, start
+
+def elapsed_ms(future, start):
+    # Done callbacks fire just after result() waiters wake, so fall back to now in that window
+    return ((getattr(future, "done_at", None) or time.perf_counter()) - start) * 1000
+
+def rescale_detections(detections, scale):
+    """Map boxes from the decoded frame back to the uploaded image's pixel space.
+
+    Returns the confidence sum, folded into the same pass so the caller doesn't walk
+    the list again for avg_confidence.
+    """
+    sx, sy = scale
+    conf_sum = 0.0
+    for det in detections:
+        conf_sum += det["confidence"]
+        if sx != 1 or sy != 1:
+            x1, y1, x2, y2 = det["bbox"]
+            det["bbox"] = [x1 * sx, y1 * sy, x2 * sx, y2 * sy]
+    return conf_sum
+
+def ojson(obj, status=200):
+    """orjson-backed stand-in for jsonify; numpy scalars/arrays serialize natively."""
+    return Response(orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY),
+                    status=status, mimetype='application/json')
 
 # ── ENDPOINTS ──
 
 @app.route('/api/health', methods=['GET'])
 def health():
-    return jsonify({
+    return ojson({
         "status": "healthy",
         "yolov5_loaded": yolo_detector is not None,
         "detr_loaded": detr_detector is not None,
@@ -45,84 +147,100 @@ def health():
         "device": str(torch.device("cuda" if torch.cuda.is_available() else "cpu"))
     })
 
+# Hardcoded metrics from our evaluation in the notebook, serialized once at import
+METRICS_JSON = orjson.dumps({
+    "yolov5": {
+        "map_50": 0.82,
+        "map_75": 0.55,
+        "avg_inference_ms": 8.5,
+        "precision": 0.85,
+        "recall": 0.78,
+        "params_millions": 7.2,
+        "fps": 117.6
+    },
+    "detr": {
+        "map_50": 0.79,
+        "map_75": 0.52,
+        "avg_inference_ms": 25.4,
+        "precision": 0.82,
+        "recall": 0.75,
+        "params_millions": 41.5,
+        "fps": 39.4
+    }
+})
+
 @app.route('/api/metrics', methods=['GET'])
 def get_metrics():
-    # Hardcoded metrics from our evaluation in the notebook
-    return jsonify({
-        "yolov5": {
-            "map_50": 0.82,
-            "map_75": 0.55,
-            "avg_inference_ms": 8.5,
-            "precision": 0.85,
-            "recall": 0.78,
-            "params_millions": 7.2,
-            "fps": 117.6
-        },
-        "detr": {
-            "map_50": 0.79,
-            "map_75": 0.52,
-            "avg_inference_ms": 25.4,
-            "precision": 0.82,
-            "recall": 0.75,
-            "params_millions": 41.5,
-            "fps": 39.4
-        }
-    })
+    return Response(METRICS_JSON, mimetype='application/json')
 
 @app.route('/api/detect', methods=['POST'])
 def detect():
     data = request.json
     if not data or 'image' not in data:
-        return jsonify({"error": "No image data provided"}), 400
+        return ojson({"error": "No image data provided"}, 400)
+
+    # Start decoding right away; it runs while the rest of the request is parsed
+    decode_future = decode_executor.submit(decode_image, data['image'])
 
     model_type = data.get('model', 'both') # 'yolov5', 'detr', or 'both'
     conf_threshold = float(data.get('conf_threshold', 0.5))
     iou_threshold = float(data.get('iou_threshold', 0.45))
+    # Callers that only want coordinates can skip the draw + JPEG encode entirely
+    return_image = parse_bool(data.get('return_image'), default=True)
 
-    # Decode base64 image
     try:
-        header, encoded = data['image'].split(",", 1) if "," in data['image'] else (None, data['image'])
-        image_data = base64.b64decode(encoded)
-        image = Image.open(BytesIO(image_data)).convert("RGB")
+        image, scale = decode_future.result()
     except Exception as e:
-        return jsonify({"error": f"Invalid image data: {e}"}), 400
+        return ojson({"error": f"Invalid image data: {e}"}, 400)
 
     response = {}
+    run_yolo = model_type in ['yolov5', 'both'] and yolo_detector
+    run_detr = model_type in ['detr', 'both'] and detr_detector
+
+    # Queue both models before waiting on either; each batcher worker runs on its own stream
+    yolo_future, yolo_start = submit_timed(yolo_batcher, image, conf_threshold, iou_threshold) if run_yolo else (None, None)
+    detr_future, detr_start = submit_timed(detr_batcher, image, conf_threshold) if run_detr else (None, None)
 
     # Run YOLOv5
-    if model_type in ['yolov5', 'both'] and yolo_detector:
-        start_time = time.time()
-        # Create a copy for drawing
-        img_yolo = image.copy()
-        detections = yolo_detector.detect(image, conf_threshold, iou_threshold)
-        image_with_boxes = yolo_detector.draw_boxes(img_yolo, detections)
-        inf_time = (time.time() - start_time) * 1000
+    if run_yolo:
+        detections = yolo_future.result()
+        inf_time = elapsed_ms(yolo_future, yolo_start)
+        if return_image:
+            # draw_boxes draws on its own copy, so DETR still gets the clean frame
+            image_with_boxes = yolo_detector.draw_boxes(image, detections)
+        conf_sum = rescale_detections(detections, scale)
         
         response['yolov5'] = {
             "detections": detections,
-            "inference_time_ms": float(round(float(inf_time), 2)),
+            "inference_time_ms": round(inf_time, 2),
             "num_objects": len(detections),
-            "avg_confidence": sum(d['confidence'] for d in detections)/len(detections) if detections else 0,
-            "image_with_boxes": image_with_boxes
+            "avg_confidence": conf_sum / len(detections) if detections else 0,
         }
+        if return_image:
+            response['yolov5']["image_with_boxes"] = image_with_boxes
+            # Decoded-frame size; bboxes are in upload pixels (see decode_image)
+            response['yolov5']["image_with_boxes_size"] = [image.width, image.height]
 
     # Run DETR
-    if model_type in ['detr', 'both'] and detr_detector:
-        start_time = time.time()
-        img_detr = image.copy()
-        detections = detr_detector.detect(image, conf_threshold)
-        image_with_boxes = detr_detector.draw_boxes(img_detr, detections)
-        inf_time = (time.time() - start_time) * 1000
+    if run_detr:
+        detections = detr_future.result()
+        inf_time = elapsed_ms(detr_future, detr_start)
+        if return_image:
+            image_with_boxes = detr_detector.draw_boxes(image, detections)
+        conf_sum = rescale_detections(detections, scale)
         
         response['detr'] = {
             "detections": detections,
-            "inference_time_ms": float(round(float(inf_time), 2)),
+            "inference_time_ms": round(inf_time, 2),
             "num_objects": len(detections),
-            "avg_confidence": sum(d['confidence'] for d in detections)/len(detections) if detections else 0,
-            "image_with_boxes": image_with_boxes
+            "avg_confidence": conf_sum / len(detections) if detections else 0,
         }
+        if return_image:
+            response['detr']["image_with_boxes"] = image_with_boxes
+            # Decoded-frame size; bboxes are in upload pixels (see decode_image)
+            response['detr']["image_with_boxes_size"] = [image.width, image.height]
 
-    return jsonify(response)
+    return ojson(response)
 
 if __name__ == '__main__':
     # Run on 5000
@@ -0,0 +1,106 @@
+"""
+Request coalescing for detector inference.
+
+Concurrent requests submit single images (blocking, or awaitable via
+``submit_async``); a background worker per model drains
+up to ``max_batch_size`` pending items (waiting at most ``max_batch_delay_ms``
+for stragglers) and runs them through one batched forward pass.
+"""
+
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List
+
+
+class MicroBatcher:
+    def __init__(self, batch_fn: Callable[..., List], max_batch_size: int = 8,
+                 max_batch_delay_ms: float = 5.0, name: str = "detector"):
+        """
+        Args:
+            batch_fn: Called as ``batch_fn(images, *args)``; must return one result per image.
+            max_batch_size: Upper bound on images per forward pass.
+            max_batch_delay_ms: How long the first request in a batch may wait for company.
+            name: Used to label the worker thread.
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_batch_delay = max_batch_delay_ms / 1000.0
+        self.name = name
+        self._queue: "queue.Queue" = queue.Queue()
+        self._worker = None
+        self._worker_pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_worker(self):
+        # Started lazily and per-process: threads don't survive fork, so a batcher built
+        # in a preloading gunicorn master gets a fresh queue + worker in each child
+        if self._worker_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._worker_pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._worker = threading.Thread(target=self._run, args=(self._queue,),
+                                            name=f"{self.name}-batcher", daemon=True)
+            self._worker.start()
+            self._worker_pid = os.getpid()
+
+    def submit(self, image, *args) -> Future:
+        """Enqueue one image. Extra args (e.g. thresholds) must be hashable."""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((image, args, future))
+        return future
+
+    def __call__(self, image, *args):
+        """Blocking convenience wrapper around ``submit``."""
+        return self.submit(image, *args).result()
+
+    async def submit_async(self, image, *args):
+        """Awaitable ``submit`` for asyncio callers; the event loop never blocks on the forward pass."""
+        return await asyncio.wrap_future(self.submit(image, *args))
+
+    def _collect(self, q: "queue.Queue") -> list:
+        batch = [q.get()]
+        deadline = time.perf_counter() + self.max_batch_delay
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(q.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, q: "queue.Queue"):
+        while True:
+            batch = self._collect(q)
+
+            # Requests with different thresholds can't share a forward pass
+            groups = {}
+            for item in batch:
+                groups.setdefault(item[1], []).append(item)
+
+            for args, items in groups.items():
+                # Futures cancelled while queued (e.g. an awaiting task was cancelled) are
+                # dropped; resolving them would raise InvalidStateError and kill this thread
+                items = [item for item in items if item[2].set_running_or_notify_cancel()]
+                if not items:
+                    continue
+                images = [image for image, _, _ in items]
+                try:
+                    results = list(self.batch_fn(images, *args))
+                    if len(results) != len(items):
+                        raise RuntimeError(
+                            f"{self.name}: batch_fn returned {len(results)} results for {len(items)} images")
+                except Exception as e:
+                    for _, _, future in items:
+                        future.set_exception(e)
+                    continue
+                for (_, _, future), result in zip(items, results):
+                    future.set_result(result)
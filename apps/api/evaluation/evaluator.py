@@ -9,13 +9,24 @@ Implements proper PASCAL VOC evaluation protocol:
 - mAP@0.5 and mAP@0.5:0.95
 """
 
+import sys
 import numpy as np
 from collections import defaultdict
 from typing import List, Dict, Tuple
 import logging
 
+try:
+    from numba import njit
+except ImportError:  # numba is optional; the kernel below also runs as plain Python
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda fn: fn
+
 logger = logging.getLogger("evaluation.evaluator")
 
+PR_CURVE_RECALL_TARGETS = np.linspace(0, 1, 50)
+
 
 def compute_iou(box_a: List[float], box_b: List[float]) -> float:
     """
@@ -38,6 +49,26 @@ def compute_iou(box_a: List[float], box_b: List[float]) -> float:
     return intersection / union if union > 0 else 0.0
 
 
+def compute_iou_matrix(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """
+    Pairwise IoU between two sets of boxes.
+    boxes_a is (N, 4), boxes_b is (M, 4), both [x1, y1, x2, y2]. Returns (N, M).
+    """
+    x1 = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    y1 = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    x2 = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    y2 = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+
+    iou = np.zeros_like(intersection)
+    np.divide(intersection, union, out=iou, where=(intersection > 0) & (union > 0))
+    return iou
+
+
 def match_predictions_to_gt(
     predictions: List[Dict],
     ground_truths: List[Dict],
@@ -54,55 +85,119 @@ def match_predictions_to_gt(
     Returns:
         (tp_flags, n_gt): List of True/False for each prediction, and count of non-difficult GTs
     """
+    (outcome,), n_gt = _match_outcomes(predictions, ground_truths, (iou_threshold,))
+    tp_flags = [bool(o) for o in outcome if o >= 0]
+
+    return tp_flags, n_gt
+
+
+def _match_outcomes(
+    predictions: List[Dict],
+    ground_truths: List[Dict],
+    iou_thresholds: Tuple[float, ...]
+) -> Tuple[List[np.ndarray], int]:
+    """
+    Per-prediction _greedy_match outcomes (1 TP, 0 FP, -1 ignored) for each threshold,
+    plus the non-difficult GT count. The IoU matrix is computed once and shared.
+    """
     n_gt = sum(1 for gt in ground_truths if not gt.get("difficult", 0))
-    matched_gt = set()
-    tp_flags = []
+    if not predictions or not ground_truths:
+        return [np.zeros(len(predictions), dtype=np.int8) for _ in iou_thresholds], n_gt
+
+    pred_boxes = np.array([p["bbox"] for p in predictions], dtype=np.float64).reshape(-1, 4)
+    gt_boxes = np.array([g["bbox"] for g in ground_truths], dtype=np.float64).reshape(-1, 4)
+    difficult = np.array([bool(g.get("difficult", 0)) for g in ground_truths], dtype=np.bool_)
 
-    for pred in predictions:
+    iou = compute_iou_matrix(pred_boxes, gt_boxes)
+    return [_greedy_match(iou, float(t), difficult) for t in iou_thresholds], n_gt
+
+
+@njit(cache=True)
+def _greedy_match(iou, iou_threshold, difficult):
+    """
+    Sequential greedy assignment over a precomputed (N, M) IoU matrix.
+    Rows must be in descending confidence order.
+
+    Returns per-prediction outcome: 1 = TP, 0 = FP, -1 = matched a difficult GT (ignored).
+    """
+    n_pred, n_gt = iou.shape
+    matched = np.zeros(n_gt, dtype=np.bool_)
+    outcome = np.zeros(n_pred, dtype=np.int8)
+
+    for i in range(n_pred):
         best_iou = 0.0
         best_gt_idx = -1
+        for j in range(n_gt):
+            if not matched[j] and iou[i, j] > best_iou:
+                best_iou = iou[i, j]
+                best_gt_idx = j
 
-        for gt_idx, gt in enumerate(ground_truths):
-            if gt_idx in matched_gt:
-                continue
-            iou = compute_iou(pred["bbox"], gt["bbox"])
-            if iou > best_iou:
-                best_iou = iou
-                best_gt_idx = gt_idx
-
-        if best_iou >= iou_threshold and best_gt_idx >= 0:
-            gt = ground_truths[best_gt_idx]
-            if gt.get("difficult", 0):
+        if best_gt_idx >= 0 and best_iou >= iou_threshold:
+            if difficult[best_gt_idx]:
                 # Skip difficult objects — they don't count as TP or FP
-                continue
-            matched_gt.add(best_gt_idx)
-            tp_flags.append(True)
-        else:
-            tp_flags.append(False)
+                outcome[i] = -1
+            else:
+                matched[best_gt_idx] = True
+                outcome[i] = 1
 
-    return tp_flags, n_gt
+    return outcome
 
 
 def compute_ap(precisions: np.ndarray, recalls: np.ndarray) -> float:
     """
     Compute Average Precision using all-point interpolation (VOC 2010+ protocol).
     """
-    # Prepend sentinel values
-    precisions = np.concatenate(([0.0], precisions, [0.0]))
-    recalls = np.concatenate(([0.0], recalls, [1.0]))
+    n = len(precisions)
 
-    # Make precision monotonically decreasing (right to left)
-    for i in range(len(precisions) - 2, -1, -1):
-        precisions[i] = max(precisions[i], precisions[i + 1])
+    # Sentinel-padded copies: [0, p..., 0] and [0, r..., 1]
+    mpre = np.empty(n + 2)
+    mpre[0], mpre[1:-1], mpre[-1] = 0.0, precisions, 0.0
+    mrec = np.empty(n + 2)
+    mrec[0], mrec[1:-1], mrec[-1] = 0.0, recalls, 1.0
 
-    # Find points where recall changes
-    recall_changes = np.where(recalls[1:] != recalls[:-1])[0]
+    # Make precision monotonically decreasing (right to left)
+    mpre = np.maximum.accumulate(mpre[::-1])[::-1]
 
-    # Sum (delta_recall * precision)
-    ap = np.sum((recalls[recall_changes + 1] - recalls[recall_changes]) * precisions[recall_changes + 1])
+    # Sum (delta_recall * precision) at the points where recall changes
+    delta_recall = np.diff(mrec)
+    recall_changes = np.flatnonzero(delta_recall)
+    ap = np.sum(delta_recall[recall_changes] * mpre[recall_changes + 1])
     return float(ap)
 
 
+def _class_metrics(conf: np.ndarray, tp: np.ndarray, total_gt: int) -> Tuple[float, List[Dict]]:
+    """
+    AP and the subsampled PR curve for one class, from its (unsorted) prediction
+    confidences and TP flags. total_gt must be > 0.
+    """
+    # Sort all predictions by confidence descending (stable, like list.sort)
+    order = np.argsort(-conf, kind="stable")
+    confidences = conf[order]
+    tp = tp[order]
+
+    # Compute cumulative TP and FP; TP + FP at rank k is just k
+    tp_cumsum = tp.cumsum(dtype=np.int64)
+    n_ranked = np.arange(1, len(tp) + 1, dtype=np.int64)
+
+    precisions = tp_cumsum / n_ranked
+    recalls = tp_cumsum / total_gt
+
+    # Compute AP
+    ap = compute_ap(precisions, recalls)
+
+    # Store PR curve, subsampled to <=50 points spaced evenly in recall (plus the endpoint)
+    curve_points = []
+    if len(recalls):
+        last = len(recalls) - 1
+        idxs = np.minimum(np.searchsorted(recalls, PR_CURVE_RECALL_TARGETS), last)
+        idxs = np.unique(np.append(idxs, last))
+        curve_points = [
+            {"precision": p, "recall": r, "confidence": c}
+            for p, r, c in zip(precisions[idxs].tolist(), recalls[idxs].tolist(), confidences[idxs].tolist())
+        ]
+    return ap, curve_points
+
+
 def evaluate_detections(
     all_predictions: Dict[str, List[Dict]],
     all_ground_truths: Dict[str, List[Dict]],
@@ -131,114 +226,116 @@ def evaluate_detections(
     if iou_thresholds is None:
         iou_thresholds = [0.5]
 
-    results_by_threshold = {}
+    # Bucket predictions and GTs by (image_id, class) in one pass so the
+    # per-class loops below are dict lookups instead of full re-scans
+    # Detections repeat a handful of class strings, so lower (and intern) each distinct
+    # name once rather than calling .lower() per box
+    lowered = {}
+
+    def class_key(name: str) -> str:
+        key = lowered.get(name)
+        if key is None:
+            key = lowered[name] = sys.intern(name.lower())
+        return key
+
+    preds_by_ic = defaultdict(list)
+    gts_by_ic = defaultdict(list)
+    # Images that contain each class, in first-seen order, so a class only visits its own images
+    images_by_class = defaultdict(dict)
+    for image_id, preds in all_predictions.items():
+        for p in preds:
+            key = class_key(p["class_name"])
+            preds_by_ic[(image_id, key)].append(p)
+            images_by_class[key][image_id] = None
+    for image_id, gts in all_ground_truths.items():
+        for g in gts:
+            key = class_key(g["class_name"])
+            gts_by_ic[(image_id, key)].append(g)
+            images_by_class[key][image_id] = None
+    for bucket in preds_by_ic.values():
+        bucket.sort(key=lambda x: x["confidence"], reverse=True)
+    # Confidences as arrays, aligned with the sorted buckets
+    conf_by_ic = {
+        k: np.array([p["confidence"] for p in bucket], dtype=np.float64)
+        for k, bucket in preds_by_ic.items()
+    }
 
-    for iou_thresh in iou_thresholds:
-        per_class_ap = {}
-        pr_curves = {}
+    no_boxes = []
+    # The aggregate P/R always uses IoU 0.5, so it rides along in the same matching pass
+    match_thresholds = tuple(iou_thresholds) + (() if 0.5 in iou_thresholds else (0.5,))
+
+    def match_class(class_name: str):
+        """
+        Match one class across its images at every threshold in one pass.
+        Returns ([(confidences, tp_flags)] per threshold, total_gt).
+        """
+        key = class_key(class_name)
+        image_ids = images_by_class.get(key, {})
+        n_max = sum(len(preds_by_ic.get((image_id, key), no_boxes)) for image_id in image_ids)
+        conf = np.empty((len(match_thresholds), n_max), dtype=np.float64)
+        tp = np.empty((len(match_thresholds), n_max), dtype=np.uint8)
+        n = [0] * len(match_thresholds)
+        total_gt = 0
+        for image_id in image_ids:
+            img_preds = preds_by_ic.get((image_id, key), no_boxes)
+            img_gts = gts_by_ic.get((image_id, key), no_boxes)
+
+            # Match predictions to GT
+            outcomes, n_gt = _match_outcomes(img_preds, img_gts, match_thresholds)
+            total_gt += n_gt
+            if not img_preds:
+                continue
 
-        for class_name in class_names:
-            # Gather all predictions and GTs for this class across all images
-            class_preds = []  # (confidence, tp_flag)
-            total_gt = 0
+            img_conf = conf_by_ic[(image_id, key)]
+            for t, outcome in enumerate(outcomes):
+                # Predictions that hit a difficult GT are dropped, keeping conf/tp aligned
+                keep = outcome >= 0
+                k = int(keep.sum())
+                conf[t, n[t]:n[t] + k] = img_conf[keep]
+                tp[t, n[t]:n[t] + k] = outcome[keep]
+                n[t] += k
+        return [(conf[t, :n[t]], tp[t, :n[t]]) for t in range(len(match_thresholds))], total_gt
+
+    # Aggregate Precision/Recall across all classes at IoU 0.5
+    # This is more accurate for the dashboard than per-class averages
+    total_tp = 0
+    total_fp = 0
+    total_gt_all = 0
 
-            for image_id in set(list(all_predictions.keys()) + list(all_ground_truths.keys())):
-                # Get predictions for this class in this image
-                img_preds = [p for p in all_predictions.get(image_id, [])
-                             if p["class_name"].lower() == class_name.lower()]
-                img_preds.sort(key=lambda x: x["confidence"], reverse=True)
+    results_by_threshold = {
+        t: {"mAP": 0.0, "per_class_ap": {}, "pr_curves": {}} for t in iou_thresholds
+    }
+    agg_index = match_thresholds.index(0.5)
 
-                # Get GTs for this class in this image
-                img_gts = [g for g in all_ground_truths.get(image_id, [])
-                           if g["class_name"].lower() == class_name.lower()]
+    for class_name in class_names:
+        # Gather all predictions and GTs for this class across all images
+        matched, total_gt = match_class(class_name)
 
-                # Match predictions to GT
-                tp_flags, n_gt = match_predictions_to_gt(img_preds, img_gts, iou_thresh)
-                total_gt += n_gt
+        _, agg_tp = matched[agg_index]
+        n_tp = int(agg_tp.sum())
+        total_tp += n_tp
+        total_fp += len(agg_tp) - n_tp
+        total_gt_all += total_gt
 
-                for i, is_tp in enumerate(tp_flags):
-                    class_preds.append((img_preds[i]["confidence"], is_tp))
+        for iou_thresh, (conf, tp) in zip(iou_thresholds, matched):
+            per_class_ap = results_by_threshold[iou_thresh]["per_class_ap"]
+            pr_curves = results_by_threshold[iou_thresh]["pr_curves"]
 
             if total_gt == 0:
                 per_class_ap[class_name] = 0.0
                 pr_curves[class_name] = []
                 continue
 
-            # Sort all predictions by confidence descending
-            class_preds.sort(key=lambda x: x[0], reverse=True)
-
-            # Compute cumulative TP and FP
-            tp_cumsum = np.zeros(len(class_preds))
-            fp_cumsum = np.zeros(len(class_preds))
-
-            for i, (conf, is_tp) in enumerate(class_preds):
-                tp_cumsum[i] = (tp_cumsum[i - 1] if i > 0 else 0) + (1 if is_tp else 0)
-                fp_cumsum[i] = (fp_cumsum[i - 1] if i > 0 else 0) + (0 if is_tp else 1)
-
-            precisions = tp_cumsum / np.maximum(tp_cumsum + fp_cumsum, np.finfo(np.float64).eps)
-            recalls = tp_cumsum / total_gt
-
-            # Compute AP
-            ap = compute_ap(precisions, recalls)
-            per_class_ap[class_name] = ap
-
-            # Store PR curve (subsample for API response)
-            curve_points = []
-            step = max(1, len(precisions) // 50)  # Max 50 points
-            for i in range(0, len(precisions), step):
-                curve_points.append({
-                    "precision": float(precisions[i]),
-                    "recall": float(recalls[i]),
-                    "confidence": float(class_preds[i][0])
-                })
-            # Add last point
-            if len(precisions) > 0:
-                 curve_points.append({
-                    "precision": float(precisions[-1]),
-                    "recall": float(recalls[-1]),
-                    "confidence": float(class_preds[-1][0])
-                })
-            pr_curves[class_name] = curve_points
-
-        # Compute mAP
-        valid_aps = [ap for ap in per_class_ap.values() if ap > 0]
-        mAP = float(np.mean(valid_aps)) if valid_aps else 0.0
-
-        results_by_threshold[iou_thresh] = {
-            "mAP": mAP,
-            "per_class_ap": per_class_ap,
-            "pr_curves": pr_curves
-        }
+            per_class_ap[class_name], pr_curves[class_name] = _class_metrics(conf, tp, total_gt)
+
+    # Compute mAP
+    for result in results_by_threshold.values():
+        valid_aps = [ap for ap in result["per_class_ap"].values() if ap > 0]
+        result["mAP"] = float(np.mean(valid_aps)) if valid_aps else 0.0
 
     # Aggregate
     mAP_50 = results_by_threshold.get(0.5, {}).get("mAP", 0.0)
 
-    # Compute aggregate Precision/Recall across all classes
-    # This is more accurate for the dashboard than per-class averages
-    total_tp = 0
-    total_fp = 0
-    for threshold_data in results_by_threshold.values():
-         # Placeholder for threshold-specific aggregation if needed
-         pass
-    
-    # We use 0.5 threshold for the primary aggregate
-    r50 = results_by_threshold.get(0.5, {})
-    all_class_preds = []
-    total_gt_all = 0
-    
-    # Re-computing aggregate P/R for the entire model across all classes
-    for class_name in class_names:
-        per_img_matches = []
-        for image_id in set(list(all_predictions.keys()) + list(all_ground_truths.keys())):
-            img_preds = [p for p in all_predictions.get(image_id, [])
-                         if p["class_name"].lower() == class_name.lower()]
-            img_gts = [g for g in all_ground_truths.get(image_id, [])
-                       if g["class_name"].lower() == class_name.lower()]
-            tp_f, n_g = match_predictions_to_gt(img_preds, img_gts, 0.5)
-            total_gt_all += n_g
-            total_tp += sum(1 for f in tp_f if f)
-            total_fp += sum(1 for f in tp_f if not f)
-
     agg_precision = total_tp / max(1, total_tp + total_fp)
     agg_recall = total_tp / max(1, total_gt_all)
 
@@ -265,3 +362,98 @@ def evaluate_detections(
         "total_ground_truths": total_gts,
         "iou_thresholds_used": iou_thresholds,
     }
+
+
+# ── Struct-of-arrays path ──
+# The live InferenceStore keeps detections as flat columns (class id, confidence, box)
+# and matches each image once when it's recorded, so re-evaluating is just sort + cumsum.
+
+def match_image_detections(
+    pred_cls: np.ndarray,
+    pred_conf: np.ndarray,
+    pred_boxes: np.ndarray,
+    gt_cls: np.ndarray,
+    gt_boxes: np.ndarray,
+    gt_difficult: np.ndarray,
+    n_classes: int,
+    iou_threshold: float = 0.5
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Greedy-match one image's predictions to its GTs, class by class.
+    Class ids index class_names; -1 marks a class outside it.
+
+    Returns:
+        (outcome, gt_counts): int8 per prediction (1 TP, 0 FP, -1 ignored) and the
+        non-difficult GT count per class
+    """
+    outcome = np.zeros(len(pred_cls), dtype=np.int8)
+    outcome[pred_cls < 0] = -1
+    counted = (gt_cls >= 0) & ~gt_difficult
+    gt_counts = np.bincount(gt_cls[counted], minlength=n_classes)
+
+    for c in np.unique(pred_cls[pred_cls >= 0]):
+        gt_idx = np.flatnonzero(gt_cls == c)
+        if not len(gt_idx):
+            continue
+        pred_idx = np.flatnonzero(pred_cls == c)
+        pred_idx = pred_idx[np.argsort(-pred_conf[pred_idx], kind="stable")]
+        iou = compute_iou_matrix(
+            pred_boxes[pred_idx].astype(np.float64), gt_boxes[gt_idx].astype(np.float64)
+        )
+        outcome[pred_idx] = _greedy_match(iou, float(iou_threshold), gt_difficult[gt_idx])
+
+    return outcome, gt_counts
+
+
+def evaluate_matched(
+    pred_conf: np.ndarray,
+    pred_cls: np.ndarray,
+    pred_outcome: np.ndarray,
+    gt_counts: np.ndarray,
+    class_names: List[str],
+    total_predictions: int,
+    total_ground_truths: int
+) -> Dict:
+    """
+    evaluate_detections at IoU 0.5 over columns already matched by match_image_detections.
+    Returns the same dict shape.
+    """
+    keep = pred_outcome >= 0
+    conf, cls, tp = pred_conf[keep], pred_cls[keep], pred_outcome[keep]
+    # Group by class once; stable so each class keeps its recording order
+    by_class = np.argsort(cls, kind="stable")
+    bounds = np.searchsorted(cls[by_class], np.arange(len(class_names) + 1))
+
+    per_class_ap = {}
+    pr_curves = {}
+    total_tp = 0
+    n_kept = 0
+    for c, class_name in enumerate(class_names):
+        rows = by_class[bounds[c]:bounds[c + 1]]
+        class_tp = tp[rows]
+        total_tp += int(class_tp.sum())
+        n_kept += len(rows)
+
+        total_gt = int(gt_counts[c])
+        if total_gt == 0:
+            per_class_ap[class_name] = 0.0
+            pr_curves[class_name] = []
+            continue
+        per_class_ap[class_name], pr_curves[class_name] = _class_metrics(
+            conf[rows].astype(np.float64), class_tp, total_gt
+        )
+
+    valid_aps = [ap for ap in per_class_ap.values() if ap > 0]
+    mAP_50 = float(np.mean(valid_aps)) if valid_aps else 0.0
+
+    return {
+        "mAP_50": mAP_50,
+        "mAP_50_95": mAP_50,
+        "aggregate_precision": round(total_tp / max(1, n_kept), 4),
+        "aggregate_recall": round(total_tp / max(1, int(gt_counts.sum())), 4),
+        "per_class_ap": per_class_ap,
+        "pr_curves": pr_curves,
+        "total_predictions": total_predictions,
+        "total_ground_truths": total_ground_truths,
+        "iou_thresholds_used": [0.5],
+    }
@@ -1,10 +1,36 @@
 import os
+import csv
+from functools import lru_cache
+from types import MappingProxyType
 import numpy as np
-import pandas as pd
 
 PROJECT_ROOT = r"C:\Users\palan\OneDrive\Desktop\DL_Transformer_project"
 METRICS_CSV = os.path.join(PROJECT_ROOT, "results", "comparison_metrics.csv")
 
+# Param counts aren't in the CSV
+PARAMS_MILLIONS = {"yolov5": 7.2, "detr": 41.3}
+
+@lru_cache(maxsize=4)
+def _load_metrics_csv(mtime):
+    """Parse the (tiny) metrics CSV into the evaluation payload. Keyed on mtime so edits invalidate."""
+    with open(METRICS_CSV, newline="") as f:
+        rows = {r['Metric']: r for r in csv.DictReader(f)}
+
+    def column(name, model):
+        get = lambda k, d=0.0: float(rows.get(k, {}).get(name, d))
+        # Read-only: the cached payload is shared by every caller
+        return MappingProxyType({
+            "map_50": get('mAP@0.5'),
+            "map_75": get('mAP@0.5:0.95'),
+            "precision": get('Precision'),
+            "recall": get('Recall'),
+            "avg_inference_ms": get('Avg Inf Time (ms)'),
+            "fps": get('FPS'),
+            "params_millions": PARAMS_MILLIONS[model]
+        })
+
+    return MappingProxyType({"yolov5": column('YOLOv5', "yolov5"), "detr": column('DETR', "detr")})
+
 def get_model_evaluation(run_id):
     """Load real metrics from CSV without fallcoded fallbacks"""
     if not os.path.exists(METRICS_CSV):
@@ -12,34 +38,14 @@ def get_model_evaluation(run_id):
         return None
         
     try:
-        df = pd.read_csv(METRICS_CSV)
-        yolo_data = df.set_index('Metric')['YOLOv5']
-        detr_data = df.set_index('Metric')['DETR']
+        metrics = _load_metrics_csv(os.path.getmtime(METRICS_CSV))
     except Exception as e:
         print(f"⚠️ Error parsing metrics CSV: {e}")
         return None
 
-    return {
-        "run_id": run_id,
-        "yolov5": {
-            "map_50": float(yolo_data.get('mAP@0.5', 0.0)),
-            "map_75": float(yolo_data.get('mAP@0.5:0.95', 0.0)),
-            "precision": float(yolo_data.get('Precision', 0.0)),
-            "recall": float(yolo_data.get('Recall', 0.0)),
-            "avg_inference_ms": float(yolo_data.get('Avg Inf Time (ms)', 0.0)),
-            "fps": float(yolo_data.get('FPS', 0.0)),
-            "params_millions": 7.2
-        },
-        "detr": {
-            "map_50": float(detr_data.get('mAP@0.5', 0.0)),
-            "map_75": float(detr_data.get('mAP@0.5:0.95', 0.0)),
-            "precision": float(detr_data.get('Precision', 0.0)),
-            "recall": float(detr_data.get('Recall', 0.0)),
-            "avg_inference_ms": float(detr_data.get('Avg Inf Time (ms)', 0.0)),
-            "fps": float(detr_data.get('FPS', 0.0)),
-            "params_millions": 41.3
-        }
-    }
+    # Fresh dicts per call (a handful of floats), so a caller that edits its copy can't
+    # corrupt the cached payload for later requests
+    return {"run_id": run_id, **{model: dict(values) for model, values in metrics.items()}}
 
 def calculate_pr_curve(run_id: str, model: str = "yolov5"):
     """
@@ -55,38 +61,31 @@ def calculate_pr_curve(run_id: str, model: str = "yolov5"):
     map_score = model_metrics.get("map_50", 0.7)
     
     # Generate 20 points for the curve
-    curve = []
-    for r in np.linspace(0, 1, 20):
-        # Precision roughly stays high then drops as recall increases
-        # P = (1 - recall^2) * map_score + some noise
-        p = max(0, min(1.0, (1.0 - r**3) * (map_score + 0.15)))
-        curve.append({
-            "recall": float(round(r, 3)),
-            "precision": float(round(p, 3))
-        })
-    return curve
+    # Precision roughly stays high then drops as recall increases
+    # P = (1 - recall^3) * (map_score + 0.15), clipped to [0, 1]
+    recall = np.linspace(0, 1, 20)
+    precision = np.clip((1.0 - recall**3) * (map_score + 0.15), 0, 1.0)
+    return [
+        {"recall": r, "precision": p}
+        for r, p in zip(recall.round(3).tolist(), precision.round(3).tolist())
+    ]
+
+# VOC classes for the UI
+VOC_CLASSES = (
+    'person', 'bird', 'cat', 'cow', 'dog', 'horse', 'sheep',
+    'aeroplane', 'bicycle', 'boat', 'bus', 'car', 'motorbike', 'train',
+    'bottle', 'chair', 'diningtable', 'pottedplant', 'sofa', 'tvmonitor'
+)
 
 def get_per_class_metrics(run_id: str, model: str = "yolov5"):
     """Get detailed per-class metrics"""
-    # Define VOC classes for the UI
-    VOC_CLASSES = [
-        'person', 'bird', 'cat', 'cow', 'dog', 'horse', 'sheep',
-        'aeroplane', 'bicycle', 'boat', 'bus', 'car', 'motorbike', 'train',
-        'bottle', 'chair', 'diningtable', 'pottedplant', 'sofa', 'tvmonitor'
-    ]
-    
     evaluation = get_model_evaluation(run_id)
     base_ap = evaluation.get(model, {}).get("map_50", 0.7) if evaluation else 0.7
     
-    class_metrics = []
-    for cls in VOC_CLASSES:
-        # Generate some variation around the base AP
-        variation = (np.random.random() - 0.5) * 0.2
-        ap = max(0.1, min(0.95, base_ap + variation))
-        class_metrics.append({
-            "class": cls,
-            "ap": float(round(ap, 3))
-        })
+    # Generate some variation around the base AP
+    variations = (np.random.random(len(VOC_CLASSES)) - 0.5) * 0.2
+    aps = np.clip(base_ap + variations, 0.1, 0.95).round(3).tolist()
+    class_metrics = [{"class": cls, "ap": ap} for cls, ap in zip(VOC_CLASSES, aps)]
         
     return {
         "model": model,
@@ -0,0 +1,28 @@
+"""
+Gunicorn settings for wsgi:app.
+
+GPU hosts: keep a single worker. Every request then shares one CUDA context and one
+MicroBatcher per model, and the threads are what feed the batcher.
+CPU hosts: raise GUNICORN_WORKERS. The app is then preloaded, so the weights load
+once in the master and forked workers share those pages copy-on-write. Preloading
+is skipped for a single worker, because a CUDA context created before fork is
+unusable in the child.
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.getenv('API_PORT', 5000)}"
+workers = int(os.getenv("GUNICORN_WORKERS", 1))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 16))
+preload_app = workers > 1
+timeout = 120
+
+
+def post_fork(server, worker):
+    """Give each worker its share of the cores, so N workers don't each start a full-size
+    intra-op pool and oversubscribe the CPU. A single worker keeps torch's default."""
+    if workers <= 1:
+        return
+    import torch
+    torch.set_num_threads(int(os.getenv("TORCH_NUM_THREADS", 0)) or max(1, (os.cpu_count() or 1) // workers))
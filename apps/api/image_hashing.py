@@ -0,0 +1,56 @@
+"""
+Content keys for matching uploads against the VOC image set.
+
+Only the first ``PREFIX_BYTES`` of a file are hashed, with the total length mixed in
+as the seed, giving a 64-bit int key. JPEGs that share a 64 KB prefix *and* a byte
+length are not a concern across ~17k VOC frames. Kept free of torch/FastAPI imports
+so process-pool workers stay cheap to spawn.
+"""
+
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import xxhash
+
+    def digest(data: bytes) -> str:
+        return xxhash.xxh3_64(data).hexdigest()
+
+    def int_digest(data, seed: int = 0) -> int:
+        return xxhash.xxh3_64_intdigest(data, seed)
+except ImportError:  # xxhash is optional; blake2b is still several times faster than md5
+    import hashlib
+
+    def digest(data: bytes) -> str:
+        return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+    def int_digest(data, seed: int = 0) -> int:
+        salt = (seed & 0xFFFFFFFFFFFFFFFF).to_bytes(8, "little")
+        return int.from_bytes(hashlib.blake2b(data, digest_size=8, salt=salt).digest(), "little")
+
+PREFIX_BYTES = 64 * 1024
+
+
+def content_key(image_bytes: bytes) -> int:
+    """Key for an in-memory image (e.g. an upload). The prefix is hashed in place, not copied."""
+    return int_digest(memoryview(image_bytes)[:PREFIX_BYTES], len(image_bytes))
+
+
+def _hash_file(path: str) -> int:
+    with open(path, "rb") as f:
+        prefix = f.read(PREFIX_BYTES)
+        size = os.fstat(f.fileno()).st_size
+    return int_digest(prefix, size)
+
+
+def build_hash_map(image_dir: str, ext: str = ".jpg", max_workers: int = None) -> dict:
+    """Returns {content_key: image_id} for every ``ext`` file in ``image_dir``, hashed in parallel."""
+    entries = [e for e in os.scandir(image_dir) if e.is_file() and e.name.endswith(ext)]
+    paths = [e.path for e in entries]
+    # spawn, not fork: this runs inside the API process alongside the model-load (CUDA) and
+    # batcher threads, and forking a multithreaded process can deadlock the children
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(),
+                             mp_context=multiprocessing.get_context("spawn")) as pool:
+        keys = pool.map(_hash_file, paths, chunksize=256)
+        return {key: os.path.splitext(e.name)[0] for key, e in zip(keys, entries)}
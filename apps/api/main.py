@@ -3,11 +3,13 @@ import time
 import base64
 import uuid
 import asyncio
-import json
+import threading
+import orjson
 import logging
+from contextlib import asynccontextmanager
 from io import BytesIO
 from collections import deque
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Literal
 from PIL import Image
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
@@ -19,18 +21,27 @@ from pydantic import BaseModel, Field
 
 from .models.yolov5_detector import YOLOv5Detector
 from .models.detr_detector import DETRDetector
-from .evaluation.evaluator import evaluate_detections, compute_iou
+from .batching import MicroBatcher
+from .image_hashing import build_hash_map, content_key, digest
+from .evaluation.evaluator import evaluate_detections, evaluate_matched, match_image_detections
 import sys
 from pathlib import Path
 # Add core to path for pipeline access
 sys.path.append(str(Path(__file__).parent.parent.parent / "core"))
 from pipeline.voc_parser import get_dataset_stats, parse_voc_annotation
-import hashlib
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("visionforge")
 
-app = FastAPI(title="VisionForge AI API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Model loading and the VOC scans run in the background; failures are logged by
+    # _log_task_failure instead of disappearing with an unreferenced task
+    await startup_event()
+    await build_hashes_task()
+    yield
+
+app = FastAPI(title="VisionForge AI API", lifespan=lifespan)
 
 # ── CORS ──
 app.add_middleware(
@@ -49,9 +60,40 @@ DATA_DIR = MONOREPO_ROOT / "data"
 
 YOLO_PATH = str(CORE_DIR / "ml" / "yolov5su.pt")
 DETR_PATH = "facebook/detr-resnet-50"
+# TensorRT engines from core/ml/export_tensorrt.py; used on CUDA hosts when present
+YOLO_ENGINE_PATH = str(CORE_DIR / "ml" / "yolov5su_int8.engine")
+# YOLO engine with NMS fused in (EfficientNMS_TRT), used for requests at the default IoU
+YOLO_NMS_ENGINE_PATH = str(CORE_DIR / "ml" / "yolov5su_nms_fp16.engine")
+DETR_ENGINE_PATH = str(CORE_DIR / "ml" / "detr_fp16.engine")
+# Without a usable DETR engine, an FP16 plan is built from this ONNX export and cached per GPU
+DETR_ONNX_PATH = str(CORE_DIR / "ml" / "detr.onnx")
+# CPU-only hosts run this dynamic-INT8 export with ONNX Runtime (core/ml/export_detr.py)
+DETR_ONNX_INT8_PATH = str(CORE_DIR / "ml" / "detr_int8.onnx")
+# Opt-in: torch.compile the PyTorch models at load time (slower startup, faster steady state)
+# YOLO runtime: auto (INT8 engine if present, else .pt), trt / onnx (export next to the
+# .pt once and reuse it), or pt to force eager PyTorch
+YOLO_BACKEND = os.getenv("VF_YOLO_BACKEND", "auto").lower()
+TORCH_COMPILE = os.getenv("TORCH_COMPILE", "false").lower() == "true"
+# Opt-in: replay the eager YOLO/DETR forwards from per-shape CUDA graphs
+CUDA_GRAPHS = os.getenv("CUDA_GRAPHS", "false").lower() == "true"
+# Half-precision PyTorch inference on CUDA (fp16 for YOLO, bf16/fp16 autocast for DETR)
+FORCE_FP16 = os.getenv("FORCE_FP16", "false").lower() == "true"
+# Concurrent requests are coalesced into one forward pass per model; DETR is the memory hog
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", 8))
+DETR_MAX_BATCH_SIZE = int(os.getenv("DETR_MAX_BATCH_SIZE", 4))
+MAX_BATCH_DELAY_MS = float(os.getenv("MAX_BATCH_DELAY_MS", 10))
+# Frames evaluate-subset keeps in flight per model (decoded ahead while the previous window runs)
+EVAL_BATCH_SIZE = int(os.getenv("EVAL_BATCH_SIZE", 16))
 VOC_ROOT = str(DATA_DIR / "VOC2012_train_val" / "VOC2012_train_val")
 VOC_ANNOTATIONS = os.path.join(VOC_ROOT, "Annotations")
 VOC_IMAGES = os.path.join(VOC_ROOT, "JPEGImages")
+VOC_CLASSES = (
+    'person', 'bird', 'cat', 'cow', 'dog', 'horse', 'sheep',
+    'aeroplane', 'bicycle', 'boat', 'bus', 'car', 'motorbike', 'train',
+    'bottle', 'chair', 'diningtable', 'pottedplant', 'sofa', 'tvmonitor'
+)
+# Class name -> int16 id for the detection columns; anything else maps to -1
+VOC_CLASS_TO_ID = {name: i for i, name in enumerate(VOC_CLASSES)}
 
 # ── REQUEST MODELS ──
 class DetectRequest(BaseModel):
@@ -59,38 +101,223 @@ class DetectRequest(BaseModel):
     model: str = "both"
     conf_threshold: float = Field(0.5, ge=0.0, le=1.0)
     iou_threshold: float = Field(0.45, ge=0.0, le=1.0)
+    # "inline": image_with_boxes data URI only; "url": image_with_boxes_url only (smaller, faster);
+    # "both" is the default while image_with_boxes is deprecated (see docs/API.md)
+    image_format: Literal["inline", "url", "both"] = "both"
 
 # ── INFERENCE STORE ──
+class LatencyRing:
+    """
+    Fixed-size float64 ring buffer; values() returns samples oldest-first.
+    Keeps a running sum / sum of squares so mean() and var() are O(1).
+    """
+
+    def __init__(self, capacity: int):
+        self.buf = np.empty(capacity, dtype=np.float64)
+        self.capacity = capacity
+        self.count = 0  # total appended, so the write index is count % capacity
+        self._sum = 0.0
+        self._sum_sq = 0.0
+
+    def append(self, value: float):
+        idx = self.count % self.capacity
+        if self.count >= self.capacity:
+            old = self.buf[idx]
+            self._sum -= old
+            self._sum_sq -= old * old
+        self.buf[idx] = value
+        self._sum += value
+        self._sum_sq += value * value
+        self.count += 1
+        if self.count % self.capacity == 0:
+            # Re-sum once per wrap so add/subtract rounding can't drift
+            self._sum = float(self.buf.sum())
+            self._sum_sq = float(np.dot(self.buf, self.buf))
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def mean(self) -> float:
+        n = len(self)
+        return self._sum / n if n else 0.0
+
+    def var(self) -> float:
+        """Population variance, like np.var."""
+        n = len(self)
+        if not n:
+            return 0.0
+        mean = self._sum / n
+        return max(0.0, self._sum_sq / n - mean * mean)
+
+    def values(self) -> np.ndarray:
+        if self.count <= self.capacity:
+            return self.buf[:self.count]
+        start = self.count % self.capacity
+        return np.concatenate((self.buf[start:], self.buf[:start]))
+
+    def recent(self, n: int) -> np.ndarray:
+        """Last n samples (oldest-first)."""
+        return self.values()[-n:]
+
+
+class DetectionColumns:
+    """
+    Struct-of-arrays detection log for one model: image id, class id, confidence, box and
+    IoU-0.5 match outcome per prediction. Each image is matched once when it's added, so
+    evaluation only has to sort and cumsum. Buffers double when full.
+    """
+
+    def __init__(self, n_classes: int, capacity: int = 1024):
+        self.capacity = capacity
+        self.size = 0
+        self.n_dead = 0  # rows from images that were recorded again
+        self.img = np.empty(capacity, dtype=np.int32)
+        self.cls = np.empty(capacity, dtype=np.int16)
+        self.conf = np.empty(capacity, dtype=np.float32)
+        self.bbox = np.empty((capacity, 4), dtype=np.float32)
+        self.outcome = np.empty(capacity, dtype=np.int8)
+        self.image_index: Dict[str, int] = {}
+        # Per-image (gt_counts, n_gt) so a re-recorded image can be backed out of the totals
+        self.image_gt: Dict[int, tuple] = {}
+        self.gt_counts = np.zeros(n_classes, dtype=np.int64)
+        self.n_ground_truths = 0
+
+    def __len__(self):
+        """Number of images recorded."""
+        return len(self.image_index)
+
+    @property
+    def n_predictions(self) -> int:
+        return self.size - self.n_dead
+
+    def add_image(self, image_id: str, cls: np.ndarray, conf: np.ndarray, bbox: np.ndarray,
+                  outcome: np.ndarray, gt_counts: np.ndarray, n_gt: int):
+        """Append one image's predictions, replacing any earlier record of the same image."""
+        idx = self.image_index.get(image_id)
+        if idx is None:
+            idx = self.image_index[image_id] = len(self.image_index)
+        else:
+            self._drop(idx)
+
+        n = len(cls)
+        self._reserve(n)
+        rows = slice(self.size, self.size + n)
+        self.img[rows] = idx
+        self.cls[rows] = cls
+        self.conf[rows] = conf
+        self.bbox[rows] = bbox
+        self.outcome[rows] = outcome
+        self.size += n
+
+        self.image_gt[idx] = (gt_counts, n_gt)
+        self.gt_counts += gt_counts
+        self.n_ground_truths += n_gt
+
+    def live(self):
+        """(conf, cls, outcome) for every prediction still on record."""
+        conf, cls, outcome = self.conf[:self.size], self.cls[:self.size], self.outcome[:self.size]
+        if not self.n_dead:
+            return conf, cls, outcome
+        alive = self.img[:self.size] >= 0
+        return conf[alive], cls[alive], outcome[alive]
+
+    def _drop(self, idx: int):
+        dead = self.img[:self.size] == idx
+        self.img[:self.size][dead] = -1
+        self.n_dead += int(dead.sum())
+        gt_counts, n_gt = self.image_gt.pop(idx)
+        self.gt_counts -= gt_counts
+        self.n_ground_truths -= n_gt
+
+    def _reserve(self, n: int):
+        if self.size + n <= self.capacity:
+            return
+        keep = self.img[:self.size] >= 0 if self.n_dead else slice(0, self.size)
+        n_live = self.size - self.n_dead
+        while n_live + n > self.capacity:
+            self.capacity *= 2
+        for name in ("img", "cls", "conf", "bbox", "outcome"):
+            old = getattr(self, name)
+            new = np.empty((self.capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:n_live] = old[:self.size][keep]
+            setattr(self, name, new)
+        self.size, self.n_dead = n_live, 0
+
+
+def sse_frame(event: dict) -> bytes:
+    """One Server-Sent Events "data:" frame."""
+    return b"data: " + orjson.dumps(event, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n\n"
+
+
+class Broadcaster:
+    """
+    Fan-out for SSE frames: one shared ring of the last ``capacity`` frames, and each
+    subscriber reads from its own cursor. Publishing costs the same however many are
+    listening; a subscriber that falls a full ring behind skips what was overwritten.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.buf: List[Optional[bytes]] = [None] * capacity
+        self.capacity = capacity
+        self.head = 0  # total frames published
+        self.subscribers = 0
+        self._cond: Optional[asyncio.Condition] = None
+
+    @property
+    def cond(self) -> asyncio.Condition:
+        # Created on first use so it binds to the server's running loop (py3.9)
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    async def publish(self, frame: bytes):
+        async with self.cond:
+            self.buf[self.head % self.capacity] = frame
+            self.head += 1
+            self.cond.notify_all()
+
+    async def read(self, seen: int, timeout: float):
+        """(frames after cursor ``seen``, new cursor); raises asyncio.TimeoutError if none arrive."""
+        async with self.cond:
+            await asyncio.wait_for(self.cond.wait_for(lambda: self.head > seen), timeout)
+            seen = max(seen, self.head - self.capacity)
+            frames = [self.buf[i % self.capacity] for i in range(seen, self.head)]
+            return frames, self.head
+
+
 # Accumulates real inference results for dynamic analytics
 class InferenceStore:
     def __init__(self, max_history: int = 200):
         self.max_history = max_history
         # Per-model latency history (ms)
-        self.latency_history: Dict[str, deque] = {
-            "yolov5": deque(maxlen=max_history),
-            "detr": deque(maxlen=max_history),
+        self.latency_history: Dict[str, LatencyRing] = {
+            "yolov5": LatencyRing(max_history),
+            "detr": LatencyRing(max_history),
         }
         # Per-model FPS history (computed from latency)
         self.fps_history: Dict[str, deque] = {
             "yolov5": deque(maxlen=max_history),
             "detr": deque(maxlen=max_history),
         }
-        # Per-model all detections for PR/AP computation
-        self.all_predictions: Dict[str, Dict[str, List[Dict]]] = {
-            "yolov5": {},
-            "detr": {},
+        # Same FPS values as fps_history, for O(1) mean/variance
+        self.fps_stats: Dict[str, LatencyRing] = {
+            "yolov5": LatencyRing(max_history),
+            "detr": LatencyRing(max_history),
         }
-        # Per-model ground truths matched
-        self.all_ground_truths: Dict[str, Dict[str, List[Dict]]] = {
-            "yolov5": {},
-            "detr": {},
+        # Per-model detections (already matched against the GTs) for PR/AP computation
+        self.detections: Dict[str, DetectionColumns] = {
+            "yolov5": DetectionColumns(len(VOC_CLASSES)),
+            "detr": DetectionColumns(len(VOC_CLASSES)),
         }
-        # SSE subscribers
-        self.subscribers: List[asyncio.Queue] = []
+        # SSE fan-out of pre-encoded frames
+        self.broadcaster = Broadcaster()
+        self._heartbeat = (None, b"")
         # Inference counter
         self.inference_count = 0
-        # Last evaluation results cache
+        # Last evaluation results cache; an entry is fresh while its version matches the data's
         self.eval_cache: Dict[str, Dict] = {}
+        self._eval_version: Dict[str, int] = {"yolov5": 0, "detr": 0}
+        self._cache_version: Dict[str, int] = {}
 
     def record_inference(self, model: str, image_id: str, detections: list,
                          ground_truths: list, latency_ms: float, iteration: int = 1, total_iterations: int = 1):
@@ -109,50 +336,49 @@ class InferenceStore:
                 "fps": round(fps, 1),
                 "latency_ms": round(latency_ms, 2),
             })
+            self.fps_stats[model].append(round(fps, 1))
+
+            # Store predictions for the first run (the "official" results), highest confidence first
+            detections = sorted(detections, key=lambda d: d["confidence"], reverse=True)
+            pred_cls = np.array([VOC_CLASS_TO_ID.get(d["class"].lower(), -1) for d in detections], dtype=np.int16)
+            pred_conf = np.array([d["confidence"] for d in detections], dtype=np.float64)
+            pred_boxes = np.array([d["bbox"] for d in detections], dtype=np.float64).reshape(-1, 4)
+
+            # Match against this image's ground truths now so evaluation never re-walks old images
+            gt_cls = np.array([VOC_CLASS_TO_ID.get(g["class"].lower(), -1) for g in ground_truths], dtype=np.int16)
+            gt_boxes = np.array([g["bbox"] for g in ground_truths], dtype=np.float64).reshape(-1, 4)
+            gt_difficult = np.array([bool(g.get("difficult", 0)) for g in ground_truths], dtype=np.bool_)
+            outcome, gt_counts = match_image_detections(
+                pred_cls, pred_conf, pred_boxes, gt_cls, gt_boxes, gt_difficult, len(VOC_CLASSES)
+            )
+            self.detections[model].add_image(
+                image_id, pred_cls, pred_conf, pred_boxes, outcome, gt_counts, int((~gt_difficult).sum())
+            )
 
-            # Store predictions for the first run (the "official" results)
-            preds_formatted = [{
-                "class_name": d["class"],
-                "confidence": d["confidence"],
-                "bbox": d["bbox"],
-            } for d in detections]
-            self.all_predictions[model][image_id] = preds_formatted
-
-            # Store ground truths
-            gts_formatted = [{
-                "class_name": g["class"],
-                "bbox": g["bbox"],
-                "difficult": g.get("difficult", 0),
-            } for g in ground_truths]
-            self.all_ground_truths[model][image_id] = gts_formatted
-
-            # Invalidate eval cache
-            self.eval_cache.pop(model, None)
+            # Bump the data version; the next get_evaluation recomputes lazily
+            self._eval_version[model] = self._eval_version.get(model, 0) + 1
 
     def get_evaluation(self, model: str) -> Optional[Dict]:
         """Get or compute real evaluation metrics."""
-        if model in self.eval_cache:
+        version = self._eval_version.get(model, 0)
+        if model in self.eval_cache and self._cache_version.get(model) == version:
             return self.eval_cache[model]
 
-        preds = self.all_predictions.get(model, {})
-        gts = self.all_ground_truths.get(model, {})
-        if not preds:
+        columns = self.detections.get(model)
+        if not columns:
             return None
 
-        VOC_CLASSES = [
-            'person', 'bird', 'cat', 'cow', 'dog', 'horse', 'sheep',
-            'aeroplane', 'bicycle', 'boat', 'bus', 'car', 'motorbike', 'train',
-            'bottle', 'chair', 'diningtable', 'pottedplant', 'sofa', 'tvmonitor'
-        ]
-
         try:
-            result = evaluate_detections(
-                all_predictions=preds,
-                all_ground_truths=gts,
-                class_names=VOC_CLASSES,
-                iou_thresholds=[0.5],
+            conf, cls, outcome = columns.live()
+            result = evaluate_matched(
+                conf, cls, outcome, columns.gt_counts, VOC_CLASSES,
+                total_predictions=columns.n_predictions,
+                total_ground_truths=columns.n_ground_truths,
             )
+            # The dashboard polls the PR plot; build it once per invalidation, not per request
+            result["pr_plot"] = self._pr_plot(result["pr_curves"])
             self.eval_cache[model] = result
+            self._cache_version[model] = version
             return result
         except Exception as e:
             logger.error(f"Evaluation error for {model}: {e}")
@@ -160,19 +386,32 @@ class InferenceStore:
 
     def get_latency_distribution(self, model: str) -> list:
         """Return real latency samples binned as histogram."""
-        samples = list(self.latency_history.get(model, []))
-        if not samples:
+        ring = self.latency_history.get(model)
+        arr = ring.values() if ring is not None else np.empty(0)
+        if not len(arr):
             return []
 
-        arr = np.array(samples)
-        hist, bin_edges = np.histogram(arr, bins=min(10, len(samples)))
+        # Uniform bins, same edges as np.histogram(arr, bins=n) but without its generic setup
+        n_bins = min(10, len(arr))
+        lo, hi = float(arr.min()), float(arr.max())
+        if hi == lo:
+            # np.histogram widens a zero range to +-0.5
+            lo, hi = lo - 0.5, hi + 0.5
+        bin_edges = np.linspace(lo, hi, n_bins + 1)
+        idx = ((arr - lo) * (n_bins / (hi - lo))).astype(np.int64)
+        # The max lands exactly on the right edge, which belongs to the last bin
+        np.minimum(idx, n_bins - 1, out=idx)
+        # Fix up float rounding at bin edges the way np.histogram does
+        idx -= arr < bin_edges[idx]
+        idx += (arr >= bin_edges[idx + 1]) & (idx != n_bins - 1)
+        hist = np.bincount(idx, minlength=n_bins)
         return [
             {
                 "bin": f"{bin_edges[i]:.1f}-{bin_edges[i+1]:.1f}",
                 "count": int(hist[i]),
                 "ms": float((bin_edges[i] + bin_edges[i+1]) / 2),
             }
-            for i in range(len(hist))
+            for i in range(n_bins)
         ]
 
     def get_fps_history(self, model: str) -> list:
@@ -182,23 +421,24 @@ class InferenceStore:
     def get_pr_curve(self, model: str) -> list:
         """Return real PR curve from evaluation."""
         evaluation = self.get_evaluation(model)
-        if not evaluation or "pr_curves" not in evaluation:
+        if not evaluation:
             return []
+        return evaluation.get("pr_plot", [])
 
-        # Aggregate across all classes for overall PR curve
-        all_points = []
-        for cls_name, curve in evaluation["pr_curves"].items():
-            all_points.extend(curve)
-
-        if not all_points:
+    @staticmethod
+    def _pr_plot(pr_curves: Dict[str, list]) -> list:
+        """Aggregate the per-class curves into one list of <=50-ish points, sorted by recall."""
+        points = [p for curve in pr_curves.values() for p in curve]
+        if not points:
             return []
 
-        # Sort by recall and subsample
-        all_points.sort(key=lambda x: x["recall"])
-        step = max(1, len(all_points) // 50)
+        recall = np.fromiter((p["recall"] for p in points), dtype=np.float64, count=len(points))
+        precision = np.fromiter((p["precision"] for p in points), dtype=np.float64, count=len(points))
+        # Stable, so tied recalls keep class order like list.sort did
+        order = np.argsort(recall, kind="stable")[::max(1, len(points) // 50)]
         return [
-            {"recall": round(p["recall"], 4), "precision": round(p["precision"], 4)}
-            for p in all_points[::step]
+            {"recall": round(r, 4), "precision": round(p, 4)}
+            for r, p in zip(recall[order].tolist(), precision[order].tolist())
         ]
 
     def get_per_class_ap(self, model: str) -> list:
@@ -212,16 +452,18 @@ class InferenceStore:
             for cls_name, ap in evaluation["per_class_ap"].items()
         ]
 
+    def heartbeat_frame(self) -> bytes:
+        """Heartbeat SSE frame, re-encoded only when the inference count moves."""
+        if self._heartbeat[0] != self.inference_count:
+            self._heartbeat = (self.inference_count, sse_frame(
+                {"type": "heartbeat", "inference_count": self.inference_count}
+            ))
+        return self._heartbeat[1]
+
     async def broadcast_event(self, event: dict):
         """Send event to all SSE subscribers."""
-        dead = []
-        for q in self.subscribers:
-            try:
-                q.put_nowait(event)
-            except asyncio.QueueFull:
-                dead.append(q)
-        for q in dead:
-            self.subscribers.remove(q)
+        # Serialized once; every subscriber reads the same bytes from the ring
+        await self.broadcaster.publish(sse_frame(event))
 
 
 store = InferenceStore()
@@ -229,14 +471,26 @@ store = InferenceStore()
 # ── MODEL LOADING ──
 print("Initializing Detectors...")
 yolo_detector = None
-detr_detector = DETRDetector(DETR_PATH) # Initialize with empty status
+detr_detector = DETRDetector(DETR_PATH, engine_path=DETR_ENGINE_PATH, onnx_path=DETR_ONNX_PATH,
+                             onnx_int8_path=DETR_ONNX_INT8_PATH, trt_max_batch=DETR_MAX_BATCH_SIZE,
+                             compile_model=TORCH_COMPILE, cuda_graphs=CUDA_GRAPHS, half=FORCE_FP16) # Initialize with empty status
+yolo_batcher = None
+# Worker thread only starts on first submit, so this is safe before the weights are loaded.
+# Grad mode is thread-local, so inference_mode wraps the fn the batcher worker runs
+detr_batcher = MicroBatcher(torch.inference_mode()(detr_detector.detect_batch), DETR_MAX_BATCH_SIZE, MAX_BATCH_DELAY_MS, "detr")
 
 async def load_models_async():
-    global yolo_detector, detr_detector
+    global yolo_detector, detr_detector, yolo_batcher
     
-    # YOLOv5 usually loads fast enough, but we keep it here for consistency
+    # Built off the event loop too: a first start with VF_YOLO_BACKEND=trt|onnx runs the
+    # export, and compile/CUDA-graph warmups happen in the constructor
     try:
-        yolo_detector = YOLOv5Detector(YOLO_PATH)
+        yolo_detector = await asyncio.to_thread(
+            YOLOv5Detector, YOLO_PATH, engine_path=YOLO_ENGINE_PATH, compile_model=TORCH_COMPILE,
+            cuda_graphs=CUDA_GRAPHS, half=FORCE_FP16,
+            nms_engine_path=YOLO_NMS_ENGINE_PATH,
+            runtime=YOLO_BACKEND, export_batch=MAX_BATCH_SIZE)
+        yolo_batcher = MicroBatcher(torch.inference_mode()(yolo_detector.detect_batch), MAX_BATCH_SIZE, MAX_BATCH_DELAY_MS, "yolov5")
     except Exception as e:
         print(f"Failed to load YOLOv5: {e}")
 
@@ -247,9 +501,20 @@ async def load_models_async():
     except Exception as e:
         print(f"Async DETR Load failed: {e}")
 
-@app.on_event("startup")
+_load_models_task = None
+
+def _log_task_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Background startup task failed: {task.exception()!r}")
+
+def _background(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    task.add_done_callback(_log_task_failure)
+    return task
+
 async def startup_event():
-    asyncio.create_task(load_models_async())
+    global _load_models_task
+    _load_models_task = _background(load_models_async())
 
 # Static files
 static_dir = os.path.join(os.path.dirname(__file__), "static")
@@ -257,30 +522,150 @@ if not os.path.exists(static_dir):
     os.makedirs(static_dir)
 app.mount("/static", StaticFiles(directory=static_dir), name="static")
 
+# Annotated results are written here and served by URL instead of inline base64
+ANNOTATED_DIR = os.path.join(static_dir, "annotated")
+os.makedirs(ANNOTATED_DIR, exist_ok=True)
+ANNOTATED_MAX_FILES = int(os.getenv("ANNOTATED_MAX_FILES", 500))
+
+def _existing_annotated_files():
+    """Files left by earlier runs, oldest first, so the cap below also covers them."""
+    with os.scandir(ANNOTATED_DIR) as entries:
+        files = [(e.stat().st_mtime, e.path) for e in entries if e.name.endswith(".jpg")]
+    return [path for _, path in sorted(files)]
+
+_annotated_files = deque(_existing_annotated_files())
+_annotated_lock = threading.Lock()
+
+def save_annotated_image(jpeg_bytes: bytes) -> str:
+    """Write JPEG bytes under a content-hash name and return its /static URL (LRU-capped)."""
+    name = f"{digest(jpeg_bytes)}.jpg"
+    path = os.path.join(ANNOTATED_DIR, name)
+    with _annotated_lock:  # called from to_thread workers
+        if os.path.exists(path):
+            # Same result again: mark it recently used so the URL just handed out survives the trim
+            try:
+                _annotated_files.remove(path)
+            except ValueError:
+                pass
+            os.utime(path)
+        else:
+            tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(jpeg_bytes)
+            os.replace(tmp_path, path)  # atomic, so a reader never sees a half-written file
+        _annotated_files.append(path)
+        # Least recently used go first once the cap is hit (also trims what earlier runs left behind)
+        while len(_annotated_files) > ANNOTATED_MAX_FILES:
+            try:
+                os.remove(_annotated_files.popleft())
+            except OSError:
+                pass
+    return f"/static/annotated/{name}"
+
 # ── HELPER: Image Hashing for VOC Matching ──
-VOC_HASH_MAP = {}
+VOC_HASH_MAP: Dict[int, str] = {}  # content_key -> image_id
 
 def build_voc_hash_map():
-    """Compute hashes for all VOC images to match against uploads."""
+    """Compute content keys for all VOC images to match against uploads."""
     if not os.path.exists(VOC_IMAGES):
         return
     print("Building VOC Image Hash Map...")
-    for fname in os.listdir(VOC_IMAGES):
-        if fname.endswith(".jpg"):
-            img_id = os.path.splitext(fname)[0]
-            # Just use first 8k for speed if needed, but VOC images are small
-            with open(os.path.join(VOC_IMAGES, fname), "rb") as f:
-                h = hashlib.md5(f.read()).hexdigest()
-                VOC_HASH_MAP[h] = img_id
-
-@app.on_event("startup")
+    VOC_HASH_MAP.update(build_hash_map(VOC_IMAGES))
+    print(f"VOC Image Hash Map ready: {len(VOC_HASH_MAP)} images")
+
+# Image listing and class -> images index, built once so /api/dataset/samples doesn't
+# list the directory and re-parse every XML per request
+VOC_ALL_IMAGES: List[str] = []
+VOC_ALL_XML: List[str] = []
+VOC_CLASS_TO_IMAGES: Dict[str, List[str]] = {}
+
+def _list_dir(path: str, exts) -> List[str]:
+    """File names in path with one of exts; scandir reads names without a stat per entry."""
+    with os.scandir(path) as entries:
+        return [e.name for e in entries if e.name.endswith(exts)]
+
+def build_voc_class_index():
+    """List VOC images/annotations and index the images by the classes they contain."""
+    if os.path.exists(VOC_ANNOTATIONS):
+        VOC_ALL_XML[:] = _list_dir(VOC_ANNOTATIONS, '.xml')
+    if not os.path.exists(VOC_IMAGES):
+        return
+    images = _list_dir(VOC_IMAGES, ('.jpg', '.jpeg', '.png'))
+    index: Dict[str, List[str]] = {}
+    if VOC_ALL_XML:
+        annotated = set(VOC_ALL_XML)
+        for img_file in images:
+            xml_name = os.path.splitext(img_file)[0] + ".xml"
+            if xml_name not in annotated:
+                continue
+            xml_path = os.path.join(VOC_ANNOTATIONS, xml_name)
+            try:
+                data = parse_voc_annotation(xml_path)
+            except Exception:
+                continue
+            for cls in dict.fromkeys(obj["class"] for obj in data["objects"]):
+                index.setdefault(cls, []).append(img_file)
+    VOC_CLASS_TO_IMAGES.update(index)
+    VOC_ALL_IMAGES[:] = images
+    print(f"VOC class index ready: {len(images)} images, {len(index)} classes")
+
+_hash_map_task = None
+_class_index_task = None
+
 async def build_hashes_task():
-    asyncio.to_thread(build_voc_hash_map)
+    global _hash_map_task, _class_index_task
+    # Keep references so the tasks aren't garbage-collected mid-scan
+    _hash_map_task = _background(asyncio.to_thread(build_voc_hash_map))
+    _class_index_task = _background(asyncio.to_thread(build_voc_class_index))
+
+def voc_hash_map_built() -> bool:
+    return _hash_map_task is not None and _hash_map_task.done()
+
+# The event loop only keeps weak references to tasks; these hold deferred GT recordings
+_deferred_records = set()
+
+def record_with_ground_truth(model_name, image_id, image_data, dets, latency, iterations):
+    """Record the first run with its VOC ground truth, without making the response wait for the scan."""
+    if voc_hash_map_built():
+        gt = find_ground_truth_for_image(image_data)
+        store.record_inference(model_name, image_id, dets, gt, latency, 1, iterations)
+        return
+
+    # Mid-scan (or scan not started): record once the map is ready rather than with no GT
+    async def record_when_indexed():
+        await voc_hash_map_ready()
+        gt = find_ground_truth_for_image(image_data)
+        store.record_inference(model_name, image_id, dets, gt, latency, 1, iterations)
+
+    task = _background(record_when_indexed())
+    _deferred_records.add(task)
+    task.add_done_callback(_deferred_records.discard)
+
+async def voc_hash_map_ready():
+    """Wait for the startup hash scan (or start it, if the lifespan hook didn't run)."""
+    global _hash_map_task
+    if _hash_map_task is None:
+        _hash_map_task = _background(asyncio.to_thread(build_voc_hash_map))
+    try:
+        # shield: a cancelled request must not cancel the shared build
+        await asyncio.shield(_hash_map_task)
+    except Exception:
+        pass  # already logged by _log_task_failure; serve without the index
+
+async def voc_class_index_ready():
+    """Wait for the startup index build (or start it, if the lifespan hook didn't run)."""
+    global _class_index_task
+    if _class_index_task is None:
+        _class_index_task = _background(asyncio.to_thread(build_voc_class_index))
+    try:
+        # shield: a cancelled request must not cancel the shared build
+        await asyncio.shield(_class_index_task)
+    except Exception:
+        pass  # already logged by _log_task_failure; serve without the index
 
 def find_ground_truth_for_image(image_bytes: bytes) -> list:
     """Match uploaded image hash against VOC for real ground truth."""
-    h = hashlib.md5(image_bytes).hexdigest()
-    image_id = VOC_HASH_MAP.get(h)
+    image_id = VOC_HASH_MAP.get(content_key(image_bytes))
     if image_id:
         logger.info(f"Match found in VOC: {image_id}")
         return load_voc_ground_truth(image_id)
@@ -319,6 +704,15 @@ async def health():
 
 
 # ── CORE: DETECT ENDPOINT ──
+def _decode_image(raw: str):
+    """Base64 (optionally a data URI) -> (raw bytes, RGB PIL image)."""
+    if "," in raw:
+        _, raw = raw.split(",", 1)
+    image_data = base64.b64decode(raw)
+    image = Image.open(BytesIO(image_data)).convert("RGB")
+    return image_data, image
+
+
 @app.post("/api/detect")
 async def detect(req: DetectRequest):
     """
@@ -327,28 +721,36 @@ async def detect(req: DetectRequest):
     """
     logger.info(f"[INFERENCE] model={req.model} conf={req.conf_threshold} iou={req.iou_threshold}")
 
-    # Decode base64 image
+    # Decode base64 image off the event loop; b64decode and libjpeg both release the GIL
     try:
-        raw = req.image
-        if "," in raw:
-            _, raw = raw.split(",", 1)
-        image_data = base64.b64decode(raw)
-        image = Image.open(BytesIO(image_data)).convert("RGB")
+        image_data, image = await asyncio.to_thread(_decode_image, req.image)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid image data: {e}")
 
     image_id = f"upload_{uuid.uuid4().hex[:8]}"
     response = {}
 
-    async def run_model_inference(model_name, detector, iterations=1):
-        # Initial run (with drawing)
+    async def run_model_inference(model_name, detector, batcher, iterations=1):
+        # DETR has no NMS stage, so only YOLO takes the IoU threshold
+        args = (req.conf_threshold, req.iou_threshold) if model_name == "yolov5" else (req.conf_threshold,)
+
+        # Initial run (with drawing); routed through the model's micro-batcher so concurrent
+        # requests share a forward pass and the event loop stays free meanwhile
         start = time.perf_counter()
-        dets = detector.detect(image, req.conf_threshold, req.iou_threshold if hasattr(detector, 'detect') and 'iou_threshold' in detector.detect.__code__.co_varnames else None)
-        img_with_boxes = detector.draw_boxes(image.copy(), dets)
+        dets = await batcher.submit_async(image, *args)
+        def annotate():
+            # draw_boxes works on its own copy, so the background profiling runs still see a clean frame
+            jpeg = detector.draw_boxes(image, dets, as_jpeg_bytes=True)
+            fields = {}
+            if req.image_format in ("url", "both"):
+                fields["image_with_boxes_url"] = save_annotated_image(jpeg)
+            if req.image_format in ("inline", "both"):
+                fields["image_with_boxes"] = f"data:image/jpeg;base64,{base64.b64encode(jpeg).decode('ascii')}"
+            return fields
+        image_fields = await asyncio.to_thread(annotate)
         latency = (time.perf_counter() - start) * 1000
         
-        gt = find_ground_truth_for_image(image_data)
-        store.record_inference(model_name, image_id, dets, gt, latency, 1, iterations)
+        record_with_ground_truth(model_name, image_id, image_data, dets, latency, iterations)
 
         # Telemetry for first run
         await store.broadcast_event({
@@ -365,11 +767,12 @@ async def detect(req: DetectRequest):
         # Background Profiling (Multiple iterations)
         if iterations > 1:
             async def profile_task():
+                submit = batcher.submit_async
                 for i in range(2, iterations + 1):
                     # Sleep slightly to avoid complete CPU lockup if on single core
                     await asyncio.sleep(0.01)
                     p_start = time.perf_counter()
-                    _ = detector.detect(image, req.conf_threshold)
+                    _ = await submit(image, *args)
                     p_lat = (time.perf_counter() - p_start) * 1000
                     store.record_inference(model_name, image_id, [], [], p_lat, i, iterations)
                     
@@ -379,7 +782,7 @@ async def detect(req: DetectRequest):
                             "model": model_name,
                             "iteration": i,
                             "total": iterations,
-                            "avg_latency": round(float(np.mean(list(store.latency_history[model_name])[-i:])), 2),
+                            "avg_latency": round(float(np.mean(store.latency_history[model_name].recent(i))), 2),
                             "log": f"[{model_name.upper()}] Profiling: {i}/{iterations} runs complete..."
                         })
             
@@ -390,19 +793,25 @@ async def detect(req: DetectRequest):
             "inference_time_ms": round(latency, 2),
             "num_objects": len(dets),
             "avg_confidence": round(sum(d["confidence"] for d in dets) / len(dets), 4) if dets else 0,
-            "image_with_boxes": img_with_boxes,
+            **image_fields,
         }
 
+    runs = {}
     if req.model in ["yolov5", "both"] and yolo_detector:
-        response["yolov5"] = await run_model_inference("yolov5", yolo_detector, 20)
+        runs["yolov5"] = run_model_inference("yolov5", yolo_detector, yolo_batcher, 20)
 
     if req.model in ["detr", "both"] and detr_detector:
         # Check if DETR is actually ready
         if detr_detector.status == "Ready":
-            response["detr"] = await run_model_inference("detr", detr_detector, 10) # 10 for DETR since it's slower
+            runs["detr"] = run_model_inference("detr", detr_detector, detr_batcher, 10) # 10 for DETR since it's slower
         else:
             logger.warning("DETR not ready, skipping from dual mode")
 
+    # Independent models on their own batcher threads and CUDA streams, so in "both" mode
+    # the request waits for the slower one rather than the sum
+    for model_name, result in zip(runs, await asyncio.gather(*runs.values())):
+        response[model_name] = result
+
     if not response:
         raise HTTPException(status_code=503, detail="Requested models are still initializing or failed to load.")
 
@@ -424,12 +833,10 @@ async def get_latest_metrics():
     """Return real metrics computed from inference history."""
     result = {"run_id": "latest"}
     for model in ["yolov5", "detr"]:
-        latencies = list(store.latency_history[model])
-        fps_data = store.get_fps_history(model)
         evaluation = store.get_evaluation(model)
 
-        avg_latency = np.mean(latencies) if latencies else 0
-        avg_fps = np.mean([f["fps"] for f in fps_data]) if fps_data else 0
+        avg_latency = store.latency_history[model].mean()
+        avg_fps = store.fps_stats[model].mean()
 
         if evaluation:
             result[model] = {
@@ -494,7 +901,8 @@ async def dataset_stats():
     if not os.path.exists(VOC_ANNOTATIONS):
         raise HTTPException(status_code=404, detail="VOC annotations directory not found")
 
-    stats = get_dataset_stats(VOC_ANNOTATIONS)
+    # Fans the XML parsing out to a process pool; keep the wait off the event loop
+    stats = await asyncio.to_thread(get_dataset_stats, VOC_ANNOTATIONS)
     if stats is None:
         raise HTTPException(status_code=500, detail="Failed to parse dataset")
 
@@ -508,41 +916,50 @@ async def dataset_samples(cls: Optional[str] = None, count: int = 10):
     if not os.path.exists(VOC_IMAGES):
         raise HTTPException(status_code=404, detail="VOC images directory not found")
 
-    all_images = [f for f in os.listdir(VOC_IMAGES) if f.endswith(('.jpg', '.jpeg', '.png'))]
+    await voc_class_index_ready()
+    all_images = VOC_ALL_IMAGES
 
     if cls and os.path.exists(VOC_ANNOTATIONS):
-        # Filter images containing the specified class
-        filtered = []
-        for img_file in all_images:
-            xml_name = os.path.splitext(img_file)[0] + ".xml"
-            xml_path = os.path.join(VOC_ANNOTATIONS, xml_name)
-            if os.path.exists(xml_path):
-                try:
-                    data = parse_voc_annotation(xml_path)
-                    if any(obj["class"] == cls for obj in data["objects"]):
-                        filtered.append(img_file)
-                except Exception:
-                    continue
-        all_images = filtered
+        # Images containing the specified class
+        all_images = VOC_CLASS_TO_IMAGES.get(cls, [])
 
     # Sample
     import random
     sample_files = random.sample(all_images, min(count, len(all_images)))
 
-    samples = []
-    for fname in sample_files:
-        img_path = os.path.join(VOC_IMAGES, fname)
-        try:
-            with Image.open(img_path) as img:
-                img.thumbnail((256, 256))
-                buf = BytesIO()
-                img.save(buf, format="JPEG", quality=75)
-                b64 = base64.b64encode(buf.getvalue()).decode("utf-8")
-                samples.append({"filename": fname, "data": b64})
-        except Exception:
-            continue
+    # Decode in worker threads; Pillow releases the GIL inside libjpeg
+    samples = await asyncio.gather(*(asyncio.to_thread(_sample_thumbnail, f) for f in sample_files))
+    return [s for s in samples if s is not None]
+
+
+def _sample_thumbnail(fname: str) -> Optional[Dict]:
+    """256px base64 JPEG thumbnail of one VOC image, or None if it can't be read."""
+    img_path = os.path.join(VOC_IMAGES, fname)
+    try:
+        with Image.open(img_path) as img:
+            # Let libjpeg scale by 1/2..1/8 during the DCT instead of decoding full size
+            img.draft("RGB", (512, 512))
+            img.load()
+            img.thumbnail((256, 256), Image.BILINEAR)
+            buf = BytesIO()
+            img.save(buf, format="JPEG", quality=75)
+    except Exception:
+        return None
+    return {"filename": fname, "data": base64.b64encode(buf.getvalue()).decode("utf-8")}
+
 
-    return samples
+def _load_eval_sample(image_id: str):
+    """(image_id, RGB image, GT objects) for one VOC image, or None if it can't be read."""
+    img_path = os.path.join(VOC_IMAGES, f"{image_id}.jpg")
+    if not os.path.exists(img_path):
+        return None
+    try:
+        pil_img = Image.open(img_path).convert("RGB")
+        gt_data = parse_voc_annotation(os.path.join(VOC_ANNOTATIONS, f"{image_id}.xml"))
+    except Exception as e:
+        logger.warning(f"Skipping {image_id}: {e}")
+        return None
+    return image_id, pil_img, gt_data["objects"]
 
 
 @app.get("/api/dataset/evaluate-subset")
@@ -562,59 +979,72 @@ async def evaluate_subset(
     if detector is None:
         raise HTTPException(status_code=500, detail=f"{model} detector not loaded")
 
-    # Get all XML files
-    xml_files = [f for f in os.listdir(VOC_ANNOTATIONS) if f.endswith('.xml')]
+    # All XML files, listed once at startup
+    await voc_class_index_ready()
+    xml_files = VOC_ALL_XML
     import random
     subset_size = max(1, int(len(xml_files) * subset_pct))
     subset = random.sample(xml_files, subset_size)
 
-    VOC_CLASSES = [
-        'person', 'bird', 'cat', 'cow', 'dog', 'horse', 'sheep',
-        'aeroplane', 'bicycle', 'boat', 'bus', 'car', 'motorbike', 'train',
-        'bottle', 'chair', 'diningtable', 'pottedplant', 'sofa', 'tvmonitor'
-    ]
+    batcher = yolo_batcher if model == "yolov5" else detr_batcher
+    args = (conf_threshold, 0.45) if model == "yolov5" else (conf_threshold,)
+    # On GPU, submit a window of frames at once so the batcher fills its batches;
+    # on CPU keep one frame at a time like before
+    window = EVAL_BATCH_SIZE if torch.cuda.is_available() else 1
+    image_ids = [os.path.splitext(xml_file)[0] for xml_file in subset]
+    chunks = [image_ids[i:i + window] for i in range(0, len(image_ids), window)]
 
-    all_preds = {}
-    all_gts = {}
-    total_latency = 0
+    def load_chunk(chunk):
+        return asyncio.gather(*(asyncio.to_thread(_load_eval_sample, image_id) for image_id in chunk))
 
-    for xml_file in subset:
-        image_id = os.path.splitext(xml_file)[0]
-        img_path = os.path.join(VOC_IMAGES, f"{image_id}.jpg")
-        xml_path = os.path.join(VOC_ANNOTATIONS, xml_file)
+    async def timed(coro):
+        t0 = time.perf_counter()
+        dets = await coro
+        return dets, (time.perf_counter() - t0) * 1000
 
-        if not os.path.exists(img_path):
+    all_preds = {}
+    all_gts = {}
+    total_latency = 0   # per-image submit -> result, summed
+    total_wall = 0      # wall time of each GPU window, summed (amortized over its frames)
+
+    # Decode the next window while the current one is on the GPU
+    pending = load_chunk(chunks[0]) if chunks else None
+    for k in range(len(chunks)):
+        loaded = [sample for sample in await pending if sample is not None]
+        pending = load_chunk(chunks[k + 1]) if k + 1 < len(chunks) else None
+        if not loaded:
             continue
 
-        try:
-            pil_img = Image.open(img_path).convert("RGB")
-            gt_data = parse_voc_annotation(xml_path)
-
-            start = time.perf_counter()
-            if model == "yolov5":
-                dets = detector.detect(pil_img, conf_threshold, 0.45)
-            else:
-                dets = detector.detect(pil_img, conf_threshold)
-            latency = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(timed(batcher.submit_async(pil_img, *args)) for _, pil_img, _ in loaded),
+            return_exceptions=True,
+        )
+        total_wall += (time.perf_counter() - start) * 1000
+
+        for (image_id, _, gt_objects), result in zip(loaded, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Skipping {image_id}: {result}")
+                continue
+            dets, latency = result
             total_latency += latency
-
             all_preds[image_id] = [
                 {"class_name": d["class"], "confidence": d["confidence"], "bbox": d["bbox"]}
                 for d in dets
             ]
             all_gts[image_id] = [
                 {"class_name": o["class"], "bbox": o["bbox"], "difficult": 0}
-                for o in gt_data["objects"]
+                for o in gt_objects
             ]
-        except Exception as e:
-            logger.warning(f"Skipping {image_id}: {e}")
-            continue
 
     if not all_preds:
         return {"error": "No images processed", "subset_size": 0}
 
     evaluation = evaluate_detections(all_preds, all_gts, VOC_CLASSES, [0.5])
+    # avg_latency_ms stays per-image latency (what each frame waited, batching included);
+    # the batched throughput view is amortized_ms_per_image
     avg_latency = total_latency / len(all_preds)
+    amortized = total_wall / len(all_preds)
 
     return {
         "model": model,
@@ -624,7 +1054,8 @@ async def evaluate_subset(
         "mAP_50": round(evaluation["mAP_50"], 4),
         "per_class_ap": {k: round(v, 4) for k, v in evaluation["per_class_ap"].items()},
         "avg_latency_ms": round(avg_latency, 2),
-        "total_time_s": round(total_latency / 1000, 2),
+        "amortized_ms_per_image": round(amortized, 2),
+        "total_time_s": round(total_wall / 1000, 2),
     }
 
 
@@ -633,27 +1064,28 @@ async def evaluate_subset(
 @app.get("/api/telemetry/stream")
 async def telemetry_stream(request: Request):
     """Server-Sent Events stream for real-time inference telemetry."""
-    queue = asyncio.Queue(maxsize=100)
-    store.subscribers.append(queue)
+    broadcaster = store.broadcaster
+    seen = broadcaster.head  # only events published from now on
 
     async def event_generator():
+        nonlocal seen
+        broadcaster.subscribers += 1
         try:
             # Send initial connection event
-            yield f"data: {json.dumps({'type': 'connected', 'inference_count': store.inference_count})}\n\n"
+            yield sse_frame({"type": "connected", "inference_count": store.inference_count})
 
             while True:
                 # Check if client disconnected
                 if await request.is_disconnected():
                     break
                 try:
-                    event = await asyncio.wait_for(queue.get(), timeout=15.0)
-                    yield f"data: {json.dumps(event)}\n\n"
+                    frames, seen = await broadcaster.read(seen, timeout=15.0)
+                    yield b"".join(frames)
                 except asyncio.TimeoutError:
                     # Send heartbeat
-                    yield f"data: {json.dumps({'type': 'heartbeat', 'inference_count': store.inference_count})}\n\n"
+                    yield store.heartbeat_frame()
         finally:
-            if queue in store.subscribers:
-                store.subscribers.remove(queue)
+            broadcaster.subscribers -= 1
 
     return StreamingResponse(
         event_generator(),
@@ -689,9 +1121,9 @@ async def integrity_check():
 
     # Check latency variance (identical latencies = dummy)
     for model in ["yolov5", "detr"]:
-        latencies = list(store.latency_history[model])
+        latencies = store.latency_history[model]
         if len(latencies) >= 3:
-            variance = np.var(latencies)
+            variance = latencies.var()
             is_real = variance > 0.001  # Real latencies always have some variance
             checks.append({
                 "check": f"{model}_latency_variance",
@@ -700,10 +1132,9 @@ async def integrity_check():
                 "detail": "Real variance detected" if is_real else "Suspiciously identical latencies — possible dummy values",
             })
 
-        fps_data = store.get_fps_history(model)
-        if len(fps_data) >= 3:
-            fps_vals = [f["fps"] for f in fps_data]
-            variance = np.var(fps_vals)
+        fps_stats = store.fps_stats[model]
+        if len(fps_stats) >= 3:
+            variance = fps_stats.var()
             is_real = variance > 0.01
             checks.append({
                 "check": f"{model}_fps_variance",
@@ -714,7 +1145,7 @@ async def integrity_check():
 
     # Check if predictions exist
     for model in ["yolov5", "detr"]:
-        n_preds = len(store.all_predictions.get(model, {}))
+        n_preds = len(store.detections[model])
         checks.append({
             "check": f"{model}_has_predictions",
             "passed": n_preds > 0,
@@ -739,8 +1170,8 @@ async def integrity_check():
 @app.get("/api/health/report")
 async def system_health_report():
     """Complete system health report."""
-    yolo_latencies = list(store.latency_history["yolov5"])
-    detr_latencies = list(store.latency_history["detr"])
+    yolo_latencies = store.latency_history["yolov5"]
+    detr_latencies = store.latency_history["detr"]
     yolo_eval = store.get_evaluation("yolov5")
     detr_eval = store.get_evaluation("detr")
 
@@ -764,12 +1195,12 @@ async def system_health_report():
             {
                 "name": "Stability Analysis",
                 "status": "Real" if len(yolo_latencies) >= 3 else "Insufficient Data",
-                "detail": f"Based on {len(yolo_latencies)} real latency samples" if yolo_latencies else "Need at least 3 inference runs",
+                "detail": f"Based on {len(yolo_latencies)} real latency samples" if len(yolo_latencies) else "Need at least 3 inference runs",
             },
             {
                 "name": "Telemetry Stream",
                 "status": "Live",
-                "detail": f"SSE endpoint active, {len(store.subscribers)} subscribers",
+                "detail": f"SSE endpoint active, {store.broadcaster.subscribers} subscribers",
             },
             {
                 "name": "Analytics Engine",
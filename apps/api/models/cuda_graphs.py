@@ -0,0 +1,78 @@
+import contextlib
+import threading
+import torch
+
+
+def _autocast_without_cache():
+    """
+    Same autocast state as the caller, but with the weight-cast cache off. Graph capture requires
+    it: cached fp16/bf16 weight copies made during warmup/capture are freed when the caller's
+    autocast region exits, and replays would then read freed memory.
+    """
+    if not torch.is_autocast_enabled():
+        return contextlib.nullcontext()
+    get_dtype = getattr(torch, "get_autocast_dtype", None)
+    dtype = get_dtype("cuda") if get_dtype is not None else torch.get_autocast_gpu_dtype()
+    return torch.autocast("cuda", dtype=dtype, cache_enabled=False)
+
+
+class CUDAGraphCache:
+    """
+    Replays a module's forward from captured CUDA graphs, one graph per input-shape set.
+
+    A graph only replays the exact shapes it was captured with, so every new shape
+    combination is captured on first sight (up to ``max_graphs``); past that, or if a
+    capture fails, the call runs eagerly. Outputs are cloned out of the static buffers.
+    """
+
+    def __init__(self, fn, output_names, max_graphs=8, warmup_iters=3):
+        self.fn = fn
+        self.output_names = tuple(output_names)
+        self.max_graphs = max_graphs
+        self.warmup_iters = warmup_iters
+        self.graphs = {}
+        self.uncapturable = set()
+        # Static buffers are shared per shape, so replays can't interleave
+        self.lock = threading.Lock()
+
+    def __call__(self, **inputs):
+        key = tuple((name, tuple(t.shape), t.dtype) for name, t in sorted(inputs.items()))
+        with self.lock:
+            entry = self.graphs.get(key)
+            if entry is None and key not in self.uncapturable and len(self.graphs) < self.max_graphs:
+                entry = self._capture(key, inputs)
+            if entry is None:
+                return self._select(self.fn(**inputs))
+
+            graph, static_in, static_out = entry
+            for name, tensor in inputs.items():
+                static_in[name].copy_(tensor, non_blocking=True)
+            graph.replay()
+            return {name: t.clone() for name, t in static_out.items()}
+
+    def _select(self, outputs):
+        return {name: outputs[name] for name in self.output_names}
+
+    def _capture(self, key, inputs):
+        try:
+            static_in = {name: t.clone() for name, t in inputs.items()}
+            # Warm up on a side stream so lazy inits (cudnn/cublas handles) stay out of the graph
+            side = torch.cuda.Stream()
+            side.wait_stream(torch.cuda.current_stream())
+            with _autocast_without_cache():
+                with torch.cuda.stream(side):
+                    for _ in range(self.warmup_iters):
+                        self.fn(**static_in)
+                torch.cuda.current_stream().wait_stream(side)
+
+                graph = torch.cuda.CUDAGraph()
+                with torch.cuda.graph(graph):
+                    static_out = self._select(self.fn(**static_in))
+        except Exception as e:
+            print(f"CUDA graph capture failed for {key}, running eagerly: {e}")
+            self.uncapturable.add(key)
+            return None
+
+        entry = (graph, static_in, static_out)
+        self.graphs[key] = entry
+        return entry
@@ -1,16 +1,63 @@
+import os
 import torch
+import torch.nn.functional as F
 import numpy as np
-import base64
-from io import BytesIO
-from PIL import Image, ImageDraw, ImageFont
+import cv2
+from PIL import Image
 from transformers import DetrImageProcessor, DetrForObjectDetection
+from transformers.models.detr.modeling_detr import DetrObjectDetectionOutput
+
+from .cuda_graphs import CUDAGraphCache
+from .image_encoding import encode_jpeg, encode_jpeg_data_uri
+from .trt_runtime import TRTModule, build_trt_engine, device_plan_path, trt
+
+try:
+    import onnxruntime as ort
+except ImportError:  # ONNX Runtime is optional; CPU hosts fall back to eager PyTorch
+    ort = None
+
+# DetrImageProcessor resizes the shortest edge to 800 and caps the longest at 1333;
+# the TensorRT profile built from ONNX covers that range (same as core/ml/export_tensorrt.py)
+TRT_MIN_SIDE, TRT_OPT_SHAPE, TRT_MAX_SIDE = 320, (800, 1066), 1333
+
+# COCO label id -> VOC class name for the pretrained checkpoint (91 ids, 0 is N/A);
+# ids with no VOC equivalent stay None
+_COCO_TO_VOC = [None] * 91
+for _coco_id, _voc_name in {
+    1: 'person', 2: 'bicycle', 3: 'car', 4: 'motorbike', 5: 'aeroplane',
+    6: 'bus', 7: 'train', 9: 'boat', 16: 'bird', 17: 'cat', 18: 'dog',
+    19: 'horse', 20: 'sheep', 21: 'cow', 44: 'bottle', 62: 'chair',
+    63: 'sofa', 64: 'pottedplant', 67: 'diningtable', 72: 'tvmonitor'
+}.items():
+    _COCO_TO_VOC[_coco_id] = _voc_name
+_COCO_TO_VOC = tuple(_COCO_TO_VOC)
 
 class DETRDetector:
-    def __init__(self, model_path_or_name="facebook/detr-resnet-50"):
+    def __init__(self, model_path_or_name="facebook/detr-resnet-50", engine_path=None, compile_model=False,
+                 cuda_graphs=False, half=False, onnx_path=None, trt_max_batch=8, onnx_int8_path=None):
         self.classes = ['aeroplane', 'bicycle', 'bird', 'boat', 'bottle', 'bus', 'car', 'cat', 'chair', 'cow', 'diningtable', 'dog', 'horse', 'motorbike', 'person', 'pottedplant', 'sheep', 'sofa', 'train', 'tvmonitor']
         self.colors = self._get_colors()
         self.model_path = model_path_or_name
+        # Optional TensorRT FP16 engine built by core/ml/export_tensorrt.py, or an ONNX export
+        # to build (and cache per GPU) one from on first load
+        self.engine_path = engine_path
+        self.onnx_path = onnx_path
+        self.trt_max_batch = trt_max_batch
+        self.trt_engine = None
+        # Dynamic-INT8 ONNX export (core/ml/export_detr.py), run with ONNX Runtime on CPU-only hosts
+        self.onnx_int8_path = onnx_int8_path
+        self.ort_session = None
+        self.compile_model = compile_model
+        self.cuda_graphs = cuda_graphs
+        self.graph_cache = None
+        # post_process target_sizes tensors, keyed by the batch's (w, h) sizes
+        self._target_size_cache = {}
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        # Autocast the PyTorch forward on CUDA; bf16 where supported (fp32 range, no overflow in attention)
+        self.half = half and self.device.type == "cuda"
+        self.amp_dtype = torch.bfloat16 if self.half and torch.cuda.is_bf16_supported() else torch.float16
+        # Own CUDA stream so YOLO and DETR batches from parallel workers overlap on the GPU
+        self.stream = torch.cuda.Stream() if self.device.type == "cuda" else None
         self.model = None
         self.processor = None
         self.status = "Initializing"
@@ -22,26 +69,47 @@ class DETRDetector:
 
     def load_model(self):
         """Asynchronous-friendly model loading."""
+        # Pretrained COCO checkpoint vs our fine-tuned VOC head, decided once per load
+        self._label_name = self._coco_label if self.model_path == "facebook/detr-resnet-50" else self._voc_label
         try:
             print(f"Loading DETR model: {self.model_path}")
             
             # Stage 1: Encoder/Processor
             self.stage_details["encoder"] = "Loading..."
             self.processor = DetrImageProcessor.from_pretrained(self.model_path)
+            self._init_gpu_preprocess()
             self.stage_details["encoder"] = "Ready"
 
             # Stage 2: Weights
             self.stage_details["weights"] = "Loading..."
-            if self.model_path in ["facebook/detr-resnet-50"]:
-                 self.model = DetrForObjectDetection.from_pretrained(self.model_path)
-            else:
-                 self.model = DetrForObjectDetection.from_pretrained("facebook/detr-resnet-50", 
-                                                                   num_labels=len(self.classes),
-                                                                   ignore_mismatched_sizes=True)
-                 state_dict = torch.load(self.model_path, map_location=self.device)
-                 self.model.load_state_dict(state_dict)
-            
-            self.model.to(self.device).eval()
+            self._load_engine()
+            if self.trt_engine is None:
+                self._load_ort_session()
+            if self.trt_engine is None and self.ort_session is None:
+                if self.model_path in ["facebook/detr-resnet-50"]:
+                     self.model = DetrForObjectDetection.from_pretrained(self.model_path)
+                else:
+                     self.model = DetrForObjectDetection.from_pretrained("facebook/detr-resnet-50", 
+                                                                       num_labels=len(self.classes),
+                                                                       ignore_mismatched_sizes=True)
+                     if self.model_path.endswith(".safetensors"):
+                         # mmap'd and pickle-free; see scripts/save_detr_model.py
+                         from safetensors.torch import load_file
+                         state_dict = load_file(self.model_path, device=str(self.device))
+                     else:
+                         state_dict = torch.load(self.model_path, map_location=self.device)
+                     self.model.load_state_dict(state_dict)
+                
+                self.model.to(self.device).eval()
+                if self.device.type == "cuda":
+                    # TF32 tensor cores for whatever still runs in fp32 (everything, without FORCE_FP16)
+                    torch.set_float32_matmul_precision("high")
+                if self.compile_model:
+                    # Compiled on the warmup forward below, not on the first request
+                    # (reduce-overhead already replays through CUDA graphs)
+                    self.model = torch.compile(self.model, mode="reduce-overhead")
+                elif self.cuda_graphs and self.device.type == "cuda":
+                    self.graph_cache = CUDAGraphCache(self.model, ("logits", "pred_boxes"))
             self.stage_details["weights"] = "Ready"
 
             # Stage 3: Warmup
@@ -50,94 +118,243 @@ class DETRDetector:
             self.stage_details["warmup"] = "Ready"
             
             self.status = "Ready"
-            print(f"DETR model fully loaded on {self.device}.")
+            backend = "PyTorch"
+            if self.trt_engine is not None:
+                backend = "TensorRT"
+            elif self.ort_session is not None:
+                backend = "ONNX Runtime INT8"
+            elif self.compile_model:
+                backend = "PyTorch (compiled)"
+            elif self.graph_cache is not None:
+                backend = "PyTorch (CUDA graphs)"
+            if self.half and self.model is not None:
+                backend += f", {str(self.amp_dtype).split('.')[-1]} autocast"
+            print(f"DETR model fully loaded on {self.device} ({backend}).")
         except Exception as e:
             self.status = "Failed"
             print(f"Failed to load DETR: {e}")
             raise e
 
+    def _load_engine(self):
+        """
+        Use a TensorRT engine for this GPU when there is one: the per-GPU plan cached from
+        a previous ONNX build, then the exported engine, then a fresh build from ONNX.
+        Anything failing leaves us on PyTorch.
+        """
+        if trt is None or self.device.type != "cuda":
+            return
+        cached_plan = device_plan_path(self.onnx_path) if self.onnx_path else None
+        for path in (cached_plan, self.engine_path):
+            if not path or not os.path.exists(path):
+                continue
+            try:
+                self.trt_engine = TRTModule(path)
+                print(f"Loaded DETR TensorRT engine: {path}")
+                return
+            except Exception as e:
+                # Typically an engine built on another GPU / TensorRT version
+                print(f"TensorRT engine {path} unusable: {e}")
+
+        if cached_plan and os.path.exists(self.onnx_path):
+            try:
+                print(f"Building DETR FP16 TensorRT plan from {self.onnx_path} (one-off, takes a few minutes)...")
+                build_trt_engine(self.onnx_path, cached_plan, self._trt_input_shapes())
+                self.trt_engine = TRTModule(cached_plan)
+                print(f"DETR TensorRT plan cached: {cached_plan}")
+            except Exception as e:
+                print(f"TensorRT build failed, falling back to PyTorch: {e}")
+                self.trt_engine = None
+
+    def _trt_input_shapes(self):
+        (h, w), lo, hi, b = TRT_OPT_SHAPE, TRT_MIN_SIDE, TRT_MAX_SIDE, self.trt_max_batch
+        return {
+            "pixel_values": ((1, 3, lo, lo), (1, 3, h, w), (b, 3, hi, hi)),
+            "pixel_mask": ((1, lo, lo), (1, h, w), (b, hi, hi)),
+        }
+
+    def _load_ort_session(self):
+        """CPU only: the quantized graph beats FP32 eager PyTorch there; on CUDA it would not."""
+        if self.device.type != "cpu" or ort is None or not self.onnx_int8_path:
+            return
+        if not os.path.exists(self.onnx_int8_path):
+            return
+        try:
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            self.ort_session = ort.InferenceSession(self.onnx_int8_path, options,
+                                                    providers=["CPUExecutionProvider"])
+            print(f"Loaded DETR INT8 ONNX model from {self.onnx_int8_path}")
+        except Exception as e:
+            self.ort_session = None
+            print(f"ONNX Runtime session unavailable, falling back to PyTorch: {e}")
+
+    def _forward(self, inputs):
+        if self.ort_session is not None:
+            logits, pred_boxes = self.ort_session.run(None, {
+                "pixel_values": inputs["pixel_values"].numpy(),
+                "pixel_mask": inputs["pixel_mask"].numpy(),
+            })
+            return DetrObjectDetectionOutput(logits=torch.from_numpy(logits), pred_boxes=torch.from_numpy(pred_boxes))
+        if self.trt_engine is not None:
+            out = self.trt_engine(**inputs)
+            return DetrObjectDetectionOutput(logits=out["logits"].float(), pred_boxes=out["pred_boxes"].float())
+        # No autocast weight cache around graph capture (see cuda_graphs._autocast_without_cache)
+        with torch.autocast("cuda", dtype=self.amp_dtype, enabled=self.half,
+                            cache_enabled=self.graph_cache is None):
+            if self.graph_cache is not None:
+                out = self.graph_cache(**inputs)
+                logits, pred_boxes = out["logits"], out["pred_boxes"]
+            else:
+                out = self.model(**inputs)
+                if not self.half:
+                    return out
+                logits, pred_boxes = out.logits, out.pred_boxes
+        # Post-processing (softmax, box rescale) stays in fp32
+        return DetrObjectDetectionOutput(logits=logits.float(), pred_boxes=pred_boxes.float())
+
     def _warmup(self):
         """Prime CUDA and internal tensors to prevent first-run lag."""
-        dummy_img = Image.fromarray(np.zeros((640, 640, 3), dtype=np.uint8))
-        inputs = self.processor(images=dummy_img, return_tensors="pt").to(self.device)
-        with torch.no_grad():
-            self.model(**inputs)
+        sizes = [(640, 640)]
+        if self.graph_cache is not None:
+            # Capture graphs up front for the shapes real traffic mostly hits: VOC frames are
+            # 500x375 / 375x500, which the processor resizes to 800x1066 / 1066x800
+            sizes += [(500, 375), (375, 500)]
+        # reduce-overhead records its CUDA graph on the second call for a shape, so give
+        # the compiled model two passes
+        passes = 2 if self.compile_model and self.model is not None else 1
+        with torch.inference_mode():
+            for w, h in sizes:
+                inputs = self._preprocess([Image.fromarray(np.zeros((h, w, 3), dtype=np.uint8))])
+                for _ in range(passes):
+                    self._forward(inputs)
+
+    def _init_gpu_preprocess(self):
+        """Fold the processor's rescale + normalize into one scale/shift pair on the GPU."""
+        if self.device.type != "cuda":
+            return
+        mean = torch.tensor(self.processor.image_mean, device=self.device).view(3, 1, 1)
+        std = torch.tensor(self.processor.image_std, device=self.device).view(3, 1, 1)
+        self._pixel_scale = 1.0 / (255.0 * std)
+        self._pixel_shift = -mean / std
+        size = self.processor.size
+        self._shortest_edge = size.get("shortest_edge", 800)
+        self._longest_edge = size.get("longest_edge", 1333)
+
+    def _resize_shape(self, h, w):
+        """DetrImageProcessor's output size: shortest edge to 800 unless the longest would pass 1333."""
+        size = self._shortest_edge
+        short, long = min(h, w), max(h, w)
+        if long / short * size > self._longest_edge:
+            size = int(round(self._longest_edge * short / long))
+        if w < h:
+            return int(size * h / w), size
+        return size, int(size * w / h)
+
+    def _preprocess(self, pil_images):
+        """
+        pixel_values/pixel_mask for a batch. On CUDA only the uint8 frames cross the bus
+        (via pinned memory); resize, normalize and padding run on the GPU. CPU keeps the
+        HF processor.
+        """
+        if self.device.type != "cuda":
+            return self.processor(images=pil_images, return_tensors="pt").to(self.device)
+
+        frames = []
+        for img in pil_images:
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            w, h = img.size
+            # Copy straight into a pinned buffer; the caching host allocator only recycles it
+            # once the async copy reading from it has finished
+            host = torch.empty((h, w, 3), dtype=torch.uint8, pin_memory=True)
+            host.numpy()[:] = np.asarray(img)
+            frame = host.to(self.device, non_blocking=True).permute(2, 0, 1).unsqueeze(0).float()
+            frame = F.interpolate(frame, size=self._resize_shape(h, w), mode="bilinear",
+                                  align_corners=False, antialias=True)[0]
+            frames.append(frame.mul_(self._pixel_scale).add_(self._pixel_shift))
+
+        # Pad bottom/right to the largest frame, like the processor's do_pad
+        max_h = max(f.shape[1] for f in frames)
+        max_w = max(f.shape[2] for f in frames)
+        pixel_values = torch.zeros((len(frames), 3, max_h, max_w), device=self.device)
+        pixel_mask = torch.zeros((len(frames), max_h, max_w), dtype=torch.int64, device=self.device)
+        for i, frame in enumerate(frames):
+            _, fh, fw = frame.shape
+            pixel_values[i, :, :fh, :fw] = frame
+            pixel_mask[i, :fh, :fw] = 1
+        return {"pixel_values": pixel_values, "pixel_mask": pixel_mask}
 
     def _get_colors(self):
-        colors = {}
-        for i, cls in enumerate(self.classes):
-            np.random.seed(i)
-            # Use same seed as YOLO for consistency
-            colors[cls] = tuple(np.random.randint(0, 255, 3).tolist())
-        return colors
+        # Same colors as the old np.random.seed(i) + randint palette, drawn from a local
+        # RandomState per class so the global RNG is left alone (YOLO and DETR match)
+        return {cls: tuple(np.random.RandomState(i).randint(0, 255, 3).tolist())
+                for i, cls in enumerate(self.classes)}
 
     def detect(self, pil_image, conf_threshold=0.7):
         """Runs inference on a PIL.Image and returns a list of detections."""
+        return self.detect_batch([pil_image], conf_threshold)[0]
+
+    def detect_batch(self, pil_images, conf_threshold=0.7):
+        """Runs one padded, batched forward pass and returns a list of detections per image."""
         try:
-            inputs = self.processor(images=pil_image, return_tensors="pt").to(self.device)
-            with torch.no_grad():
-                outputs = self.model(**inputs)
-
-            # Post-process detections
-            target_sizes = torch.tensor([pil_image.size[::-1]])
-            results = self.processor.post_process_object_detection(outputs, target_sizes=target_sizes, threshold=conf_threshold)[0]
-
-            detections = []
-            for score, label, box in zip(results["scores"], results["labels"], results["boxes"]):
-                box = [round(i, 2) for i in box.tolist()]
-                # DETR labels are 1-indexed (0 is background in some versions, but HF usually handles it)
-                # However, our VOC_CLASSES list is 0-indexed. 
-                # DETR trained on COCO has 91 classes.
-                # If using the pretrained one, we need to map COCO to VOC or just show the ID.
-                # If using custom weights, label matches our list.
-                
-                cls_id = label.item()
-                
-                # COCO to VOC mapping (COCO class ID to VOC class Name)
-                # Standard DETR is trained on COCO (91 labels, 0 is often background or N/A)
-                coco_to_voc = {
-                    1: 'person', 2: 'bicycle', 3: 'car', 4: 'motorbike', 5: 'aeroplane',
-                    6: 'bus', 7: 'train', 9: 'boat', 16: 'bird', 17: 'cat', 18: 'dog',
-                    19: 'horse', 20: 'sheep', 21: 'cow', 44: 'bottle', 62: 'chair',
-                    63: 'sofa', 64: 'pottedplant', 67: 'diningtable', 72: 'tvmonitor'
-                }
-                
-                if self.model_path == "facebook/detr-resnet-50":
-                    cls_name = coco_to_voc.get(cls_id, f"Object ({cls_id})")
-                else:
-                    cls_name = self.classes[cls_id] if cls_id < len(self.classes) else f"label_{cls_id}"
-                
-                detections.append({
-                    "class": cls_name,
-                    "confidence": float(score),
-                    "bbox": box
-                })
-            return detections
+            # Everything up to _parse_result's .tolist() runs on our stream, which is
+            # also where that implicit sync happens
+            with torch.cuda.stream(self.stream):
+                inputs = self._preprocess(pil_images)
+                with torch.inference_mode():
+                    outputs = self._forward(inputs)
+
+                # Post-process detections
+                target_sizes = self._target_sizes(pil_images)
+                results = self.processor.post_process_object_detection(outputs, target_sizes=target_sizes, threshold=conf_threshold)
+                return [self._parse_result(r) for r in results]
         except Exception as e:
             print(f"Error in DETR detection: {e}")
-            return []
+            return [[] for _ in pil_images]
 
-    def draw_boxes(self, pil_image, detections):
-        """Draws bounding boxes and labels on an image and returns base64 PNG."""
-        draw = ImageDraw.Draw(pil_image)
-        try:
-            font = ImageFont.truetype("arial.ttf", 20)
-        except:
-            font = ImageFont.load_default()
+    def _target_sizes(self, pil_images, max_entries=64):
+        """(B, 2) height/width tensor on the model's device, reused for repeat resolutions."""
+        key = tuple(img.size for img in pil_images)
+        sizes = self._target_size_cache.get(key)
+        if sizes is None:
+            if len(self._target_size_cache) >= max_entries:
+                self._target_size_cache.clear()  # arbitrary uploads shouldn't grow this forever
+            sizes = torch.tensor([size[::-1] for size in key], device=self.device)
+            self._target_size_cache[key] = sizes
+        return sizes
+
+    def _parse_result(self, results):
+        # One device->host copy per field instead of a sync per box
+        scores = results["scores"].tolist()
+        labels = results["labels"].tolist()
+        boxes = results["boxes"].tolist()
+        label_name = self._label_name
+        # Custom weights use our VOC list directly; the pretrained model goes through COCO ids
+        return [
+            {"class": label_name(label), "confidence": score, "bbox": [round(x, 2) for x in box]}
+            for score, label, box in zip(scores, labels, boxes)
+        ]
 
+    def _coco_label(self, cls_id):
+        name = _COCO_TO_VOC[cls_id] if cls_id < len(_COCO_TO_VOC) else None
+        return name or f"Object ({cls_id})"
+
+    def _voc_label(self, cls_id):
+        return self.classes[cls_id] if cls_id < len(self.classes) else f"label_{cls_id}"
+
+    def draw_boxes(self, pil_image, detections, as_jpeg_bytes=False):
+        """Draws bounding boxes and labels on an image and returns a base64 JPEG data URI (or raw JPEG bytes)."""
+        # OpenCV draws into its own copy of the frame, so the caller's image stays clean
+        arr = np.array(pil_image.convert("RGB"))
         for det in detections:
-            cls = det["class"]
-            conf = det["confidence"]
-            bbox = det["bbox"]
-            color = self.colors.get(cls, (139, 92, 246)) # Default purple
-
-            draw.rectangle(bbox, outline=color, width=4)
-            label = f"{cls} {conf:.2f}"
-            text_size = draw.textbbox((bbox[0], bbox[1]), label, font=font)
-            draw.rectangle([text_size[0], text_size[1], text_size[2], text_size[3]], fill=color)
-            draw.text((bbox[0], bbox[1]), label, fill=(255, 255, 255), font=font)
-
-        buffered = BytesIO()
-        pil_image.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
-        return f"data:image/png;base64,{img_str}"
+            label = f"{det['class']} {det['confidence']:.2f}"
+            color = self.colors.get(det["class"], (139, 92, 246)) # Default purple
+            x1, y1, x2, y2 = map(int, det["bbox"])
+
+            cv2.rectangle(arr, (x1, y1), (x2, y2), color, 4)
+            (tw, th), baseline = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
+            cv2.rectangle(arr, (x1, y1), (x1 + tw, y1 + th + baseline), color, cv2.FILLED)
+            cv2.putText(arr, label, (x1, y1 + th), cv2.FONT_HERSHEY_SIMPLEX, 0.6,
+                        (255, 255, 255), 2, cv2.LINE_AA)
+
+        return encode_jpeg(arr) if as_jpeg_bytes else encode_jpeg_data_uri(arr)
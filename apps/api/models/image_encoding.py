@@ -0,0 +1,33 @@
+import base64
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB, TJSAMP_420
+    _turbo = TurboJPEG()
+except Exception:  # PyTurboJPEG (or libturbojpeg itself) is optional; PIL still encodes JPEG
+    _turbo = None
+
+JPEG_QUALITY = 85
+
+
+def encode_jpeg(pil_image, quality=JPEG_QUALITY):
+    """Encodes an RGB PIL image (or HxWx3 uint8 array) to JPEG bytes."""
+    if _turbo is not None:
+        # TurboJPEG expects BGR by default, so pass the pixel format explicitly
+        return _turbo.encode(np.asarray(pil_image), quality=quality,
+                             pixel_format=TJPF_RGB, jpeg_subsample=TJSAMP_420)
+    if isinstance(pil_image, np.ndarray):
+        pil_image = Image.fromarray(pil_image)
+    buffered = BytesIO()
+    # 4:2:0 like the TurboJPEG path; no optimize pass (an extra Huffman scan per frame)
+    pil_image.save(buffered, format="JPEG", quality=quality, optimize=False, subsampling=2)
+    return buffered.getvalue()
+
+
+def encode_jpeg_data_uri(pil_image, quality=JPEG_QUALITY):
+    """Encodes an RGB PIL image (or array) as a `data:image/jpeg;base64,...` URI."""
+    data = encode_jpeg(pil_image, quality)
+    return f"data:image/jpeg;base64,{base64.b64encode(data).decode('utf-8')}"
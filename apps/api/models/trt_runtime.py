@@ -0,0 +1,120 @@
+import os
+import re
+import torch
+
+try:
+    import tensorrt as trt
+except ImportError:  # TensorRT is optional; detectors fall back to PyTorch
+    trt = None
+
+_TRT_TO_TORCH = {}
+if trt is not None:
+    _TRT_TO_TORCH = {
+        trt.float32: torch.float32,
+        trt.float16: torch.float16,
+        trt.int32: torch.int32,
+        trt.int64: torch.int64,
+        trt.bool: torch.bool,
+    }
+
+
+def device_plan_path(base_path):
+    """
+    Per-GPU cache location for a plan built from ``base_path`` (e.g. detr.onnx ->
+    detr.NVIDIA_A10G.trt8.6.1.plan). Plans only load on the GPU model and TensorRT
+    version that built them.
+    """
+    gpu = re.sub(r"[^A-Za-z0-9]+", "_", torch.cuda.get_device_name()).strip("_")
+    root, _ = os.path.splitext(base_path)
+    return f"{root}.{gpu}.trt{trt.__version__}.plan"
+
+
+def build_trt_engine(onnx_path, plan_path, input_shapes, fp16=True, workspace_bytes=1 << 30):
+    """
+    Parse an ONNX graph with the TensorRT builder API and serialize the plan to ``plan_path``.
+    ``input_shapes`` maps each dynamic input to its (min, opt, max) shapes.
+    """
+    if trt is None:
+        raise RuntimeError("TensorRT is not installed")
+    logger = trt.Logger(trt.Logger.WARNING)
+    builder = trt.Builder(logger)
+    # Explicit batch is the only mode (and the flag is gone) from TensorRT 10
+    flags = 0
+    if int(trt.__version__.split(".")[0]) < 10:
+        flags = 1 << int(trt.NetworkDefinitionCreationFlag.EXPLICIT_BATCH)
+    network = builder.create_network(flags)
+    parser = trt.OnnxParser(network, logger)
+    with open(onnx_path, "rb") as f:
+        if not parser.parse(f.read()):
+            errors = "; ".join(str(parser.get_error(i)) for i in range(parser.num_errors))
+            raise RuntimeError(f"Could not parse {onnx_path}: {errors}")
+
+    config = builder.create_builder_config()
+    config.set_memory_pool_limit(trt.MemoryPoolType.WORKSPACE, workspace_bytes)
+    if fp16 and builder.platform_has_fast_fp16:
+        config.set_flag(trt.BuilderFlag.FP16)
+    profile = builder.create_optimization_profile()
+    for name, (lo, opt, hi) in input_shapes.items():
+        profile.set_shape(name, lo, opt, hi)
+    config.add_optimization_profile(profile)
+
+    plan = builder.build_serialized_network(network, config)
+    if plan is None:
+        raise RuntimeError(f"TensorRT build failed for {onnx_path}")
+    tmp_path = f"{plan_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(plan)
+    os.replace(tmp_path, plan_path)  # atomic, so a concurrent loader never reads half a plan
+    return plan_path
+
+
+class TRTModule:
+    """Thin wrapper that runs a serialized TensorRT engine on torch CUDA tensors."""
+
+    def __init__(self, engine_path):
+        if trt is None:
+            raise RuntimeError("TensorRT is not installed")
+        self.logger = trt.Logger(trt.Logger.WARNING)
+        with open(engine_path, "rb") as f, trt.Runtime(self.logger) as runtime:
+            self.engine = runtime.deserialize_cuda_engine(f.read())
+        if self.engine is None:
+            raise RuntimeError(f"Could not deserialize TensorRT engine: {engine_path}")
+        self.context = self.engine.create_execution_context()
+
+        self.names = [self.engine.get_tensor_name(i) for i in range(self.engine.num_io_tensors)]
+        self.input_names = [n for n in self.names
+                            if self.engine.get_tensor_mode(n) == trt.TensorIOMode.INPUT]
+        self.output_names = [n for n in self.names if n not in self.input_names]
+
+    def __call__(self, **inputs):
+        """Runs the engine. Inputs are matched to engine bindings by name."""
+        bindings = {}
+        for name in self.input_names:
+            dtype = _TRT_TO_TORCH[self.engine.get_tensor_dtype(name)]
+            tensor = inputs[name].to(device="cuda", dtype=dtype).contiguous()
+            self.context.set_input_shape(name, tuple(tensor.shape))
+            bindings[name] = tensor
+
+        outputs = {}
+        for name in self.output_names:
+            dtype = _TRT_TO_TORCH[self.engine.get_tensor_dtype(name)]
+            shape = tuple(self.context.get_tensor_shape(name))
+            outputs[name] = torch.empty(shape, dtype=dtype, device="cuda")
+            bindings[name] = outputs[name]
+
+        # Enqueue on the caller's torch stream (detectors run on their own streams), so the engine
+        # is ordered after the preprocessing kernels / non_blocking copies that filled the inputs
+        # and before whatever reads the outputs
+        stream = torch.cuda.current_stream()
+        if hasattr(self.context, "execute_async_v3"):
+            for name, tensor in bindings.items():
+                self.context.set_tensor_address(name, tensor.data_ptr())
+            ok = self.context.execute_async_v3(stream.cuda_stream)
+        else:
+            # Pre-8.5 fallback: execute_v2 ignores torch streams, so drain ours first
+            stream.synchronize()
+            # execute_v2 expects device pointers in engine binding order
+            ok = self.context.execute_v2([bindings[n].data_ptr() for n in self.names])
+        if not ok:
+            raise RuntimeError("TensorRT execution failed")
+        return outputs
@@ -1,100 +1,260 @@
+import os
 import torch
+import torch.nn as nn
+import torch.nn.functional as F
 import numpy as np
 import cv2
-import base64
-from io import BytesIO
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image
 from ultralytics import YOLO
 
+from .cuda_graphs import CUDAGraphCache
+from .image_encoding import encode_jpeg, encode_jpeg_data_uri
+from .trt_runtime import TRTModule
+
+# COCO class index -> VOC class name for the stock 80-class YOLOv5 weights; None where
+# there is no VOC equivalent (falls back to the model's own name)
+_COCO_TO_VOC = [None] * 80
+for _coco_id, _voc_name in {
+    0: 'person', 1: 'bicycle', 2: 'car', 3: 'motorbike', 4: 'aeroplane',
+    5: 'bus', 6: 'train', 8: 'boat', 14: 'bird', 15: 'cat', 16: 'dog',
+    17: 'horse', 18: 'sheep', 19: 'cow', 39: 'bottle', 56: 'chair',
+    57: 'sofa', 58: 'pottedplant', 60: 'diningtable', 62: 'tvmonitor'
+}.items():
+    _COCO_TO_VOC[_coco_id] = _voc_name
+_COCO_TO_VOC = tuple(_COCO_TO_VOC)
+
+
+class _GraphedForward(nn.Module):
+    """
+    Stands in for the network behind ultralytics' AutoBackend and replays plain
+    forwards from CUDA graphs. Only the prediction tensor is kept; NMS ignores the rest.
+    """
+
+    def __init__(self, module, max_graphs=16):
+        super().__init__()
+        self.module = module
+        self.graphs = CUDAGraphCache(self._forward, ("preds",), max_graphs=max_graphs)
+
+    def _forward(self, images):
+        y = self.module(images)
+        return {"preds": y[0] if isinstance(y, (list, tuple)) else y}
+
+    def forward(self, im, augment=False, visualize=False, embed=None):
+        if augment or visualize or embed:
+            return self.module(im, augment=augment, visualize=visualize, embed=embed)
+        return self.graphs(images=im)["preds"]
+
+
 class YOLOv5Detector:
-    def __init__(self, model_path):
+    def __init__(self, model_path, engine_path=None, compile_model=False, half=False, cuda_graphs=False,
+                 nms_engine_path=None, nms_iou=0.45, nms_img_size=640, runtime="auto", export_batch=8):
         self.classes = ['aeroplane', 'bicycle', 'bird', 'boat', 'bottle', 'bus', 'car', 'cat', 'chair', 'cow', 'diningtable', 'dog', 'horse', 'motorbike', 'person', 'pottedplant', 'sheep', 'sofa', 'train', 'tvmonitor']
         # Generate distinct colors for each class
         self.colors = self._get_colors()
-        print(f"Loading YOLOv5 model from {model_path}...")
-        self.model = YOLO(model_path)
-        print("YOLOv5 model loaded successfully.")
+        self.model = None
+        self.backend = "pytorch"
+        # Prefer the INT8 TensorRT engine from core/ml/export_tensorrt.py when present
+        if runtime in ("auto", "trt") and engine_path and torch.cuda.is_available() and os.path.exists(engine_path):
+            try:
+                print(f"Loading YOLOv5 TensorRT engine from {engine_path}...")
+                self.model = YOLO(engine_path, task="detect")
+                self.backend = "tensorrt"
+            except Exception as e:
+                print(f"TensorRT engine unavailable, falling back to PyTorch: {e}")
+        # "trt"/"onnx": load (or export once, then reuse) an artifact next to the .pt weights
+        if self.model is None and runtime in ("trt", "onnx"):
+            self._load_exported(model_path, runtime, export_batch)
+        if self.model is None:
+            print(f"Loading YOLOv5 model from {model_path}...")
+            self.model = YOLO(model_path)
+        # Optional engine with EfficientNMS_TRT fused in (core/ml/export_tensorrt.py); it has
+        # nms_iou baked in, so other IoU requests still go through ultralytics
+        self.nms_engine = None
+        self.nms_iou = nms_iou
+        self.nms_img_size = nms_img_size
+        if runtime != "pt" and nms_engine_path and torch.cuda.is_available() and os.path.exists(nms_engine_path):
+            try:
+                self.nms_engine = TRTModule(nms_engine_path)
+                # Largest batch the engine's optimization profile accepts
+                self.nms_max_batch = self.nms_engine.engine.get_tensor_profile_shape("images", 0)[2][0]
+                print(f"Loaded YOLOv5 fused-NMS engine from {nms_engine_path}.")
+            except Exception as e:
+                self.nms_engine = None
+                print(f"Fused-NMS engine unavailable, using ultralytics NMS: {e}")
+        # FP16 weights/inputs on CUDA; TensorRT engines carry their own precision
+        self.half = half and torch.cuda.is_available() and self.backend == "pytorch"
+        # Own CUDA stream so YOLO and DETR batches from parallel workers overlap on the GPU
+        self.stream = torch.cuda.Stream() if torch.cuda.is_available() else None
+        if compile_model:
+            self._compile()
+        elif cuda_graphs:
+            self._capture_graphs()
+        print(f"YOLOv5 model loaded successfully ({self.backend}{', fp16' if self.half else ''}).")
+
+    def _load_exported(self, model_path, runtime, batch, img_size=640):
+        """
+        Load ``<weights>.engine`` / ``<weights>.onnx``, exporting it from the .pt on first use.
+        Leaves self.model unset when the export can't run here (e.g. TensorRT without a GPU).
+        """
+        fmt, backend = ("engine", "tensorrt") if runtime == "trt" else ("onnx", "onnx")
+        path = os.path.splitext(model_path)[0] + f".{fmt}"
+        try:
+            if not os.path.exists(path):
+                if fmt == "engine" and not torch.cuda.is_available():
+                    raise RuntimeError("TensorRT export needs a CUDA device")
+                print(f"Exporting YOLOv5 to {fmt} (one-off, cached at {path})...")
+                exported = YOLO(model_path).export(format=fmt, imgsz=img_size, dynamic=True, batch=batch,
+                                                   half=fmt == "engine")
+                if os.path.abspath(exported) != os.path.abspath(path):
+                    os.replace(exported, path)
+            print(f"Loading YOLOv5 {fmt} export from {path}...")
+            self.model = YOLO(path, task="detect")
+            self.backend = backend
+        except Exception as e:
+            print(f"YOLOv5 {fmt} export unavailable, falling back to PyTorch: {e}")
+
+    def _compile(self, mode="reduce-overhead"):
+        """torch.compile the network behind ultralytics' predictor. TensorRT engines are already compiled."""
+        if self.backend != "pytorch":
+            return
+        dummy_img = Image.fromarray(np.zeros((640, 640, 3), dtype=np.uint8))
+        try:
+            # The predictor (and its AutoBackend) only exists after the first predict call
+            self.model.predict(source=dummy_img, half=self.half, verbose=False)
+            autobackend = self.model.predictor.model
+            autobackend.model = torch.compile(autobackend.model, mode=mode)
+            # Trigger compilation now so the first real request doesn't pay for it
+            self.model.predict(source=dummy_img, half=self.half, verbose=False)
+            print(f"YOLOv5 compiled with torch.compile (mode={mode}).")
+        except Exception as e:
+            print(f"torch.compile failed for YOLOv5, staying eager: {e}")
+
+    def _capture_graphs(self):
+        """Replay the PyTorch forward from per-shape CUDA graphs (captured on first sight of each shape)."""
+        if self.backend != "pytorch" or not torch.cuda.is_available():
+            return
+        dummy_img = Image.fromarray(np.zeros((640, 640, 3), dtype=np.uint8))
+        try:
+            self.model.predict(source=dummy_img, half=self.half, verbose=False)
+            autobackend = self.model.predictor.model
+            autobackend.model = _GraphedForward(autobackend.model)
+            # Capture the single-frame 640x640 graph up front
+            self.model.predict(source=dummy_img, half=self.half, verbose=False)
+            print("YOLOv5 forward replays from CUDA graphs.")
+        except Exception as e:
+            print(f"CUDA graphs unavailable for YOLOv5, staying eager: {e}")
 
     def _get_colors(self):
-        # Deterministic colors based on class names
-        colors = {}
-        for i, cls in enumerate(self.classes):
-            np.random.seed(i)
-            colors[cls] = tuple(np.random.randint(0, 255, 3).tolist())
-        return colors
+        # Same colors as the old np.random.seed(i) + randint palette, drawn from a local
+        # RandomState per class so the global RNG is left alone (YOLO and DETR match)
+        return {cls: tuple(np.random.RandomState(i).randint(0, 255, 3).tolist())
+                for i, cls in enumerate(self.classes)}
 
     def detect(self, pil_image, conf_threshold=0.25, iou_threshold=0.45):
         """Runs inference on a PIL.Image and returns a list of detections."""
+        return self.detect_batch([pil_image], conf_threshold, iou_threshold)[0]
+
+    def detect_batch(self, pil_images, conf_threshold=0.25, iou_threshold=0.45):
+        """Runs one batched forward pass and returns a list of detections per image."""
         try:
-            # Convert PIL to numpy for YOLO
-            results = self.model.predict(
-                source=pil_image,
-                conf=conf_threshold,
-                iou=iou_threshold,
-                verbose=False
-            )
-            
-            detections = []
-            for r in results:
-                boxes = r.boxes
-                for box in boxes:
-                    cls_id = int(box.cls[0])
-                    
-                    # COCO to VOC mapping for standard YOLOv5 models
-                    coco_to_voc = {
-                        0: 'person', 1: 'bicycle', 2: 'car', 3: 'motorbike', 4: 'aeroplane',
-                        5: 'bus', 6: 'train', 8: 'boat', 14: 'bird', 15: 'cat', 16: 'dog',
-                        17: 'horse', 18: 'sheep', 19: 'cow', 39: 'bottle', 56: 'chair',
-                        57: 'sofa', 58: 'pottedplant', 60: 'diningtable', 62: 'tvmonitor'
-                    }
-                    
-                    # Check if model is standard COCO or our VOC
-                    # If model has 80 classes, it's likely COCO
-                    if self.model.names and len(self.model.names) > 20:
-                        cls_name = coco_to_voc.get(cls_id, self.model.names[cls_id])
-                    else:
-                        cls_name = self.classes[cls_id] if cls_id < len(self.classes) else str(cls_id)
-                        
-                    conf = float(box.conf[0])
-                    # x1, y1, x2, y2 coordinates
-                    coords = box.xyxy[0].tolist()
-                    
-                    detections.append({
-                        "class": cls_name,
-                        "confidence": conf,
-                        "bbox": coords
-                    })
-            return detections
+            if self.nms_engine is not None and abs(iou_threshold - self.nms_iou) < 1e-6:
+                with torch.cuda.stream(self.stream):
+                    return self._detect_fused(pil_images, conf_threshold)
+            with torch.cuda.stream(self.stream):
+                results = self.model.predict(
+                    source=pil_images,
+                    conf=conf_threshold,
+                    iou=iou_threshold,
+                    half=self.half,
+                    verbose=False
+                )
+                return [self._parse_result(r) for r in results]
         except Exception as e:
             print(f"Error in YOLOv5 detection: {e}")
-            return []
+            return [[] for _ in pil_images]
 
-    def draw_boxes(self, pil_image, detections):
-        """Draws bounding boxes and labels on an image and returns base64 PNG."""
-        draw = ImageDraw.Draw(pil_image)
-        # Try to load a font, fallback to default
-        try:
-            # Common paths for Windows/Linux
-            font = ImageFont.truetype("arial.ttf", 20)
-        except:
-            font = ImageFont.load_default()
+    def _letterbox(self, pil_image):
+        """Ultralytics-style letterbox on the GPU: fit into a square, pad with gray (114)."""
+        size = self.nms_img_size
+        w, h = pil_image.size
+        gain = min(size / h, size / w)
+        nh, nw = round(h * gain), round(w * gain)
+        top, left = round((size - nh) / 2 - 0.1), round((size - nw) / 2 - 0.1)
+
+        host = torch.empty((h, w, 3), dtype=torch.uint8, pin_memory=True)
+        host.numpy()[:] = np.asarray(pil_image.convert("RGB"))
+        frame = host.to("cuda", non_blocking=True).permute(2, 0, 1).unsqueeze(0).float()
+        frame = F.interpolate(frame, size=(nh, nw), mode="bilinear", align_corners=False)[0]
+        canvas = torch.full((3, size, size), 114.0, device="cuda")
+        canvas[:, top:top + nh, left:left + nw] = frame
+        return canvas, (gain, left, top, w, h)
+
+    def _detect_fused(self, pil_images, conf_threshold):
+        """Letterbox + one engine call per chunk; NMS already happened inside the engine."""
+        names = self.model.names
+        is_coco = bool(names) and len(names) > 20
+        results = []
+        for start in range(0, len(pil_images), self.nms_max_batch):
+            chunk = [self._letterbox(img) for img in pil_images[start:start + self.nms_max_batch]]
+            images = torch.stack([c[0] for c in chunk]).div_(255.0)
+            out = self.nms_engine(images=images)
+            # One device->host copy per output for the whole chunk
+            num_dets = out["num_dets"].view(-1).tolist()
+            boxes = out["det_boxes"].cpu().numpy()
+            scores = out["det_scores"].cpu().numpy()
+            classes = out["det_classes"].cpu().numpy()
 
+            for i, (_, (gain, left, top, w, h)) in enumerate(chunk):
+                n = num_dets[i]
+                keep = scores[i, :n] >= conf_threshold
+                # Undo the letterbox, then clip to the original frame
+                xyxy = (boxes[i, :n][keep] - (left, top, left, top)) / gain
+                xyxy = np.clip(xyxy, 0, (w, h, w, h))
+                results.append([
+                    {"class": self._class_name(cls_id, names, is_coco), "confidence": conf, "bbox": bbox}
+                    for cls_id, conf, bbox in zip(classes[i, :n][keep].tolist(),
+                                                  scores[i, :n][keep].tolist(), xyxy.tolist())
+                ])
+        return results
+
+    def _class_name(self, cls_id, names, is_coco):
+        if is_coco:
+            voc_name = _COCO_TO_VOC[cls_id] if cls_id < len(_COCO_TO_VOC) else None
+            return voc_name or names[cls_id]
+        return self.classes[cls_id] if cls_id < len(self.classes) else str(cls_id)
+
+    def _parse_result(self, r):
+        detections = []
+        # If model has 80 classes, it's likely COCO
+        names = self.model.names
+        is_coco = bool(names) and len(names) > 20
+        for box in r.boxes:
+            cls_name = self._class_name(int(box.cls[0]), names, is_coco)
+
+            conf = float(box.conf[0])
+            # x1, y1, x2, y2 coordinates
+            coords = box.xyxy[0].tolist()
+
+            detections.append({
+                "class": cls_name,
+                "confidence": conf,
+                "bbox": coords
+            })
+        return detections
+
+    def draw_boxes(self, pil_image, detections, as_jpeg_bytes=False):
+        """Draws bounding boxes and labels on an image and returns a base64 JPEG data URI (or raw JPEG bytes)."""
+        # OpenCV draws into its own copy of the frame, so the caller's image stays clean
+        arr = np.array(pil_image.convert("RGB"))
         for det in detections:
-            cls = det["class"]
-            conf = det["confidence"]
-            bbox = det["bbox"]
-            color = self.colors.get(cls, (255, 0, 0))
-
-            # Draw rectangle
-            draw.rectangle(bbox, outline=color, width=4)
-            
-            # Draw label
-            label = f"{cls} {conf:.2f}"
-            text_size = draw.textbbox((bbox[0], bbox[1]), label, font=font)
-            draw.rectangle([text_size[0], text_size[1], text_size[2], text_size[3]], fill=color)
-            draw.text((bbox[0], bbox[1]), label, fill=(255, 255, 255), font=font)
-
-        buffered = BytesIO()
-        pil_image.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
-        return f"data:image/png;base64,{img_str}"
+            label = f"{det['class']} {det['confidence']:.2f}"
+            color = self.colors.get(det["class"], (255, 0, 0))
+            x1, y1, x2, y2 = map(int, det["bbox"])
+
+            cv2.rectangle(arr, (x1, y1), (x2, y2), color, 4)
+            (tw, th), baseline = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
+            cv2.rectangle(arr, (x1, y1), (x1 + tw, y1 + th + baseline), color, cv2.FILLED)
+            cv2.putText(arr, label, (x1, y1 + th), cv2.FONT_HERSHEY_SIMPLEX, 0.6,
+                        (255, 255, 255), 2, cv2.LINE_AA)
+
+        return encode_jpeg(arr) if as_jpeg_bytes else encode_jpeg_data_uri(arr)
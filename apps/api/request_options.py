@@ -0,0 +1,15 @@
+"""
+Parsing for loosely-typed request options (JSON bodies from form-style clients).
+Kept free of Flask/torch imports so it can be unit-tested on its own.
+"""
+
+_FALSE_STRINGS = frozenset(("0", "false", "no", "off", ""))
+
+
+def parse_bool(value, default: bool = True) -> bool:
+    """JSON booleans/numbers as-is; strings like "false"/"0"/"no" are False (bool("false") is True)."""
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() not in _FALSE_STRINGS
+    return bool(value)
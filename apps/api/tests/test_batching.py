@@ -0,0 +1,107 @@
+import asyncio
+import os
+import threading
+import pytest
+from batching import MicroBatcher
+
+
+def test_single_request_roundtrip():
+    batcher = MicroBatcher(lambda images, k: [img * k for img in images], max_batch_size=4, max_batch_delay_ms=1)
+    assert batcher(3, 2) == 6
+
+
+def test_concurrent_requests_are_coalesced():
+    batch_sizes = []
+    release = threading.Event()
+
+    def batch_fn(images):
+        release.wait(1.0)
+        batch_sizes.append(len(images))
+        return [img + 1 for img in images]
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=8, max_batch_delay_ms=50)
+    futures = [batcher.submit(i) for i in range(5)]
+    release.set()
+
+    assert [f.result(timeout=2) for f in futures] == [1, 2, 3, 4, 5]
+    assert batch_sizes == [5]
+
+
+def test_mixed_thresholds_run_separately():
+    calls = []
+
+    def batch_fn(images, conf):
+        calls.append((conf, len(images)))
+        return [conf for _ in images]
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=8, max_batch_delay_ms=50)
+    futures = [batcher.submit(i, 0.5 if i % 2 else 0.25) for i in range(4)]
+
+    assert [f.result(timeout=2) for f in futures] == [0.25, 0.5, 0.25, 0.5]
+    assert sorted(calls) == [(0.25, 2), (0.5, 2)]
+
+
+def test_errors_propagate_to_every_caller():
+    def batch_fn(images):
+        raise RuntimeError("boom")
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=2, max_batch_delay_ms=1)
+    with pytest.raises(RuntimeError, match="boom"):
+        batcher.submit("img").result(timeout=2)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_batcher_works_in_forked_child():
+    batcher = MicroBatcher(lambda images: [img * 2 for img in images], max_batch_delay_ms=1)
+    assert batcher(1) == 2  # worker started in the parent
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.write(write_fd, str(batcher(21)).encode())
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    os.waitpid(pid, 0)
+    assert os.read(read_fd, 16) == b"42"
+
+
+def test_submit_async_resolves_on_event_loop():
+    batcher = MicroBatcher(lambda images, k: [img * k for img in images], max_batch_delay_ms=20)
+
+    async def run():
+        return await asyncio.gather(*(batcher.submit_async(i, 10) for i in range(3)))
+
+    assert asyncio.run(run()) == [0, 10, 20]
+
+
+def test_cancelled_submit_async_does_not_kill_worker():
+    release = threading.Event()
+
+    def batch_fn(images):
+        release.wait(1.0)
+        return [img + 1 for img in images]
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=1, max_batch_delay_ms=1)
+    blocker = batcher.submit(0)  # holds the worker so the next item stays queued
+
+    async def run():
+        task = asyncio.ensure_future(batcher.submit_async(1))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    release.set()
+    assert blocker.result(timeout=2) == 1
+    assert batcher.submit(41).result(timeout=2) == 42
+
+
+def test_short_results_fail_every_caller():
+    batcher = MicroBatcher(lambda images: images[:1], max_batch_size=4, max_batch_delay_ms=50)
+    futures = [batcher.submit(i) for i in range(3)]
+    for f in futures:
+        with pytest.raises(RuntimeError, match="3 images"):
+            f.result(timeout=2)
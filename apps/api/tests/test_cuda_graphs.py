@@ -0,0 +1,25 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytestmark = pytest.mark.skipif(not torch.cuda.is_available(), reason="needs CUDA")
+
+from models.cuda_graphs import CUDAGraphCache
+
+
+@pytest.mark.parametrize("amp_dtype", [None, torch.float16])
+def test_replayed_graph_matches_eager(amp_dtype):
+    torch.manual_seed(0)
+    net = torch.nn.Sequential(torch.nn.Linear(32, 64), torch.nn.ReLU(), torch.nn.Linear(64, 8)).cuda().eval()
+    fn = lambda x: {"out": net(x)}
+    cache = CUDAGraphCache(fn, ("out",))
+
+    def run(f, x):
+        with torch.inference_mode(), torch.autocast("cuda", dtype=amp_dtype or torch.float16,
+                                                    enabled=amp_dtype is not None):
+            return f(x=x)["out"]
+
+    # Capture on the first call, then replay the same shape twice in fresh autocast regions
+    for _ in range(3):
+        x = torch.randn(4, 32, device="cuda")
+        torch.testing.assert_close(run(cache, x), run(fn, x))
+    assert len(cache.graphs) == 1
@@ -0,0 +1,178 @@
+import numpy as np
+import pytest
+from evaluation.evaluator import (
+    compute_iou,
+    compute_iou_matrix,
+    match_predictions_to_gt,
+    evaluate_detections,
+    match_image_detections,
+    evaluate_matched,
+)
+
+
+def test_iou_matrix_matches_scalar_iou():
+    rng = np.random.default_rng(0)
+    a = rng.uniform(0, 50, (6, 2))
+    a = np.hstack([a, a + rng.uniform(0, 40, (6, 2))])
+    b = rng.uniform(0, 50, (4, 2))
+    b = np.hstack([b, b + rng.uniform(0, 40, (4, 2))])
+
+    matrix = compute_iou_matrix(a, b)
+    assert matrix.shape == (6, 4)
+    for i in range(6):
+        for j in range(4):
+            assert matrix[i, j] == pytest.approx(compute_iou(a[i].tolist(), b[j].tolist()))
+
+
+def test_iou_matrix_disjoint_and_degenerate_boxes():
+    a = np.array([[0, 0, 10, 10], [5, 5, 5, 5]], dtype=float)
+    b = np.array([[20, 20, 30, 30], [0, 0, 10, 10]], dtype=float)
+    np.testing.assert_allclose(compute_iou_matrix(a, b), [[0.0, 1.0], [0.0, 0.0]])
+
+
+def test_greedy_match_takes_each_gt_once():
+    gts = [{"bbox": [0, 0, 10, 10]}, {"bbox": [20, 20, 30, 30]}]
+    preds = [
+        {"bbox": [0, 0, 10, 10], "confidence": 0.9},
+        {"bbox": [1, 1, 10, 10], "confidence": 0.8},  # duplicate of the first GT
+        {"bbox": [20, 20, 30, 30], "confidence": 0.7},
+    ]
+    tp_flags, n_gt = match_predictions_to_gt(preds, gts, 0.5)
+    assert tp_flags == [True, False, True]
+    assert n_gt == 2
+
+
+def test_difficult_gt_is_neither_tp_nor_fp():
+    gts = [{"bbox": [0, 0, 10, 10], "difficult": 1}]
+    preds = [{"bbox": [0, 0, 10, 10], "confidence": 0.9}]
+    tp_flags, n_gt = match_predictions_to_gt(preds, gts, 0.5)
+    assert tp_flags == []
+    assert n_gt == 0
+
+
+def test_match_without_predictions_or_gts():
+    assert match_predictions_to_gt([], [{"bbox": [0, 0, 1, 1]}]) == ([], 1)
+    assert match_predictions_to_gt([{"bbox": [0, 0, 1, 1], "confidence": 0.5}], []) == ([False], 0)
+
+
+def test_evaluate_detections_perfect_and_missed_classes():
+    preds = {
+        "a": [{"class_name": "Cat", "confidence": 0.9, "bbox": [0, 0, 10, 10]}],
+        "b": [{"class_name": "dog", "confidence": 0.4, "bbox": [50, 50, 60, 60]}],
+    }
+    gts = {
+        "a": [{"class_name": "cat", "bbox": [0, 0, 10, 10], "difficult": 0}],
+        "b": [{"class_name": "dog", "bbox": [0, 0, 10, 10], "difficult": 0}],
+    }
+    result = evaluate_detections(preds, gts, ["cat", "dog", "bird"], [0.5])
+
+    assert result["per_class_ap"] == {"cat": pytest.approx(1.0), "dog": 0.0, "bird": 0.0}
+    assert result["mAP_50"] == pytest.approx(1.0)
+    assert result["aggregate_precision"] == 0.5
+    assert result["aggregate_recall"] == 0.5
+    assert result["total_predictions"] == 2
+    assert result["total_ground_truths"] == 2
+    assert result["pr_curves"]["bird"] == []
+
+
+def test_evaluate_detections_ap_with_false_positive_first():
+    preds = {"a": [
+        {"class_name": "cat", "confidence": 0.9, "bbox": [50, 50, 60, 60]},
+        {"class_name": "cat", "confidence": 0.8, "bbox": [0, 0, 10, 10]},
+    ]}
+    gts = {"a": [{"class_name": "cat", "bbox": [0, 0, 10, 10], "difficult": 0}]}
+    result = evaluate_detections(preds, gts, ["cat"], [0.5, 0.75])
+
+    # Precision at full recall is 1/2
+    assert result["per_class_ap"]["cat"] == pytest.approx(0.5)
+    assert result["mAP_50_95"] == pytest.approx(0.5)
+
+
+def test_evaluate_detections_keeps_confidence_aligned_past_difficult_match():
+    preds = {
+        "a": [
+            {"class_name": "cat", "confidence": 0.9, "bbox": [0, 0, 10, 10]},    # hits the difficult GT
+            {"class_name": "cat", "confidence": 0.8, "bbox": [20, 20, 30, 30]},  # TP
+            {"class_name": "cat", "confidence": 0.2, "bbox": [60, 60, 70, 70]},  # FP
+        ],
+        "b": [{"class_name": "cat", "confidence": 0.5, "bbox": [0, 0, 10, 10]}],
+    }
+    gts = {
+        "a": [
+            {"class_name": "cat", "bbox": [0, 0, 10, 10], "difficult": 1},
+            {"class_name": "cat", "bbox": [20, 20, 30, 30], "difficult": 0},
+        ],
+        "b": [{"class_name": "cat", "bbox": [0, 0, 10, 10], "difficult": 0}],
+    }
+    result = evaluate_detections(preds, gts, ["cat"], [0.5])
+
+    # Both TPs rank above the FP, so recall hits 1.0 at precision 1.0
+    assert result["per_class_ap"]["cat"] == pytest.approx(1.0)
+    assert [p["confidence"] for p in result["pr_curves"]["cat"]][:3] == [0.8, 0.5, 0.2]
+
+
+def test_pr_curve_is_capped_and_ends_at_last_prediction():
+    rng = np.random.default_rng(1)
+    gts = {f"img{i}": [{"class_name": "cat", "bbox": [0, 0, 10, 10], "difficult": 0}] for i in range(300)}
+    preds = {
+        image_id: [{"class_name": "cat", "confidence": float(rng.random()),
+                    "bbox": [0, 0, 10, 10] if rng.random() < 0.7 else [50, 50, 60, 60]}]
+        for image_id in gts
+    }
+    curve = evaluate_detections(preds, gts, ["cat"], [0.5])["pr_curves"]["cat"]
+
+    assert len(curve) <= 51
+    recalls = [p["recall"] for p in curve]
+    assert recalls == sorted(recalls)
+    assert curve[-1]["confidence"] == min(p["confidence"] for v in preds.values() for p in v)
+
+
+def test_evaluate_matched_agrees_with_evaluate_detections():
+    classes = ["cat", "dog"]
+    preds = {
+        "a": [
+            {"class_name": "cat", "confidence": 0.9, "bbox": [0, 0, 10, 10]},    # hits the difficult GT
+            {"class_name": "cat", "confidence": 0.8, "bbox": [20, 20, 30, 30]},  # TP
+            {"class_name": "dog", "confidence": 0.6, "bbox": [0, 0, 10, 10]},    # FP, no dog here
+            {"class_name": "cow", "confidence": 0.7, "bbox": [0, 0, 10, 10]},    # not evaluated
+        ],
+        "b": [
+            {"class_name": "dog", "confidence": 0.3, "bbox": [1, 1, 10, 10]},
+            {"class_name": "dog", "confidence": 0.5, "bbox": [0, 0, 10, 10]},
+        ],
+    }
+    gts = {
+        "a": [
+            {"class_name": "cat", "bbox": [0, 0, 10, 10], "difficult": 1},
+            {"class_name": "cat", "bbox": [20, 20, 30, 30], "difficult": 0},
+        ],
+        "b": [{"class_name": "dog", "bbox": [0, 0, 10, 10], "difficult": 0}],
+    }
+
+    ids = {name: i for i, name in enumerate(classes)}
+    columns = {"conf": [], "cls": [], "outcome": []}
+    gt_counts = np.zeros(len(classes), dtype=np.int64)
+    for image_id, image_preds in preds.items():
+        image_preds = sorted(image_preds, key=lambda p: p["confidence"], reverse=True)
+        pred_cls = np.array([ids.get(p["class_name"], -1) for p in image_preds], dtype=np.int16)
+        pred_conf = np.array([p["confidence"] for p in image_preds])
+        image_gts = gts[image_id]
+        outcome, counts = match_image_detections(
+            pred_cls, pred_conf, np.array([p["bbox"] for p in image_preds], dtype=float),
+            np.array([ids.get(g["class_name"], -1) for g in image_gts], dtype=np.int16),
+            np.array([g["bbox"] for g in image_gts], dtype=float),
+            np.array([bool(g["difficult"]) for g in image_gts]),
+            len(classes),
+        )
+        columns["conf"].append(pred_conf)
+        columns["cls"].append(pred_cls)
+        columns["outcome"].append(outcome)
+        gt_counts += counts
+
+    expected = evaluate_detections(preds, gts, classes, [0.5])
+    result = evaluate_matched(
+        *(np.concatenate(columns[k]) for k in ("conf", "cls", "outcome")), gt_counts, classes,
+        total_predictions=expected["total_predictions"],
+        total_ground_truths=expected["total_ground_truths"],
+    )
+    assert result == expected
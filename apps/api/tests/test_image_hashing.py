@@ -0,0 +1,20 @@
+import os
+from image_hashing import PREFIX_BYTES, build_hash_map, content_key
+
+
+def test_upload_key_matches_file_key(tmp_path):
+    big = os.urandom(PREFIX_BYTES + 1000)
+    small = os.urandom(500)
+    (tmp_path / "big.jpg").write_bytes(big)
+    (tmp_path / "small.jpg").write_bytes(small)
+    (tmp_path / "notes.txt").write_bytes(small)
+
+    hash_map = build_hash_map(str(tmp_path), max_workers=1)
+
+    assert hash_map == {content_key(big): "big", content_key(small): "small"}
+    assert isinstance(content_key(big), int)
+
+
+def test_key_includes_length_past_the_prefix():
+    data = os.urandom(PREFIX_BYTES)
+    assert content_key(data + b"a") != content_key(data + b"ab")
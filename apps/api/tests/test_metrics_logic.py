@@ -0,0 +1,17 @@
+from evaluation import metrics_logic
+
+
+def test_evaluation_copies_are_independent(tmp_path, monkeypatch):
+    csv_path = tmp_path / "comparison_metrics.csv"
+    csv_path.write_text("Metric,YOLOv5,DETR\nmAP@0.5,0.82,0.79\nFPS,117.6,39.4\n")
+    monkeypatch.setattr(metrics_logic, "METRICS_CSV", str(csv_path))
+    metrics_logic._load_metrics_csv.cache_clear()
+
+    first = metrics_logic.get_model_evaluation("latest")
+    first["yolov5"]["map_50"] = -1
+    first["detr"]["extra"] = True
+
+    second = metrics_logic.get_model_evaluation("latest")
+    assert second["yolov5"]["map_50"] == 0.82
+    assert "extra" not in second["detr"]
+    assert second["detr"]["fps"] == 39.4
@@ -0,0 +1,17 @@
+import pytest
+from request_options import parse_bool
+
+
+@pytest.mark.parametrize("value", [True, 1, "true", "True", "1", "yes", "on"])
+def test_truthy_values(value):
+    assert parse_bool(value) is True
+
+
+@pytest.mark.parametrize("value", [False, 0, "false", "FALSE", "0", "no", "off", " false "])
+def test_falsy_values(value):
+    assert parse_bool(value) is False
+
+
+def test_missing_uses_default():
+    assert parse_bool(None) is True
+    assert parse_bool(None, default=False) is False
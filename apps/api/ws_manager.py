@@ -1,28 +1,39 @@
-from typing import Dict, List
+import asyncio
+from typing import Dict, Tuple
+
+import orjson
 from fastapi import WebSocket
 
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {}
+        # Tuples swapped wholesale on connect/disconnect, so a broadcast iterating one never
+        # sees it change size underneath it (no lock needed)
+        self.active_connections: Dict[str, Tuple[WebSocket, ...]] = {}
 
     async def connect(self, run_id: str, websocket: WebSocket):
         await websocket.accept()
-        if run_id not in self.active_connections:
-            self.active_connections[run_id] = []
-        self.active_connections[run_id].append(websocket)
+        self.active_connections[run_id] = self.active_connections.get(run_id, ()) + (websocket,)
 
     def disconnect(self, run_id: str, websocket: WebSocket):
-        if run_id in self.active_connections:
-            self.active_connections[run_id].remove(websocket)
-            if not self.active_connections[run_id]:
-                del self.active_connections[run_id]
+        remaining = tuple(ws for ws in self.active_connections.get(run_id, ()) if ws is not websocket)
+        if remaining:
+            self.active_connections[run_id] = remaining
+        else:
+            self.active_connections.pop(run_id, None)
 
     async def send_personal_message(self, message: dict, websocket: WebSocket):
         await websocket.send_json(message)
 
     async def broadcast_to_run(self, run_id: str, message: dict):
-        if run_id in self.active_connections:
-            for connection in self.active_connections[run_id]:
-                await connection.send_json(message)
+        connections = self.active_connections.get(run_id, ())
+        if not connections:
+            return
+        # Serialize once and fan out concurrently, so one slow client doesn't hold up the rest.
+        # Still a text frame: the portal JSON.parses event.data
+        payload = orjson.dumps(message, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+        results = await asyncio.gather(*[ws.send_text(payload) for ws in connections], return_exceptions=True)
+        for ws, result in zip(connections, results):
+            if isinstance(result, Exception):
+                self.disconnect(run_id, ws)
 
 manager = ConnectionManager()
@@ -0,0 +1,9 @@
+"""
+WSGI entry point for the Flask API (app.py).
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Settings live in gunicorn.conf.py.
+"""
+
+from app import app
@@ -7,6 +7,7 @@ import {
 import { useInference } from "../context/InferenceContext";
 import { DetectionResponse, ModelResult } from "../types/detection.types";
 import { toast } from "sonner";
+import { getAnnotatedImageSrc } from "../utils/api";
 
 type Model = "yolov5" | "detr";
 
@@ -77,7 +78,7 @@ const DetectionPlayground = () => {
         <div className="relative aspect-video rounded-xl bg-black/40 border border-border/50 overflow-hidden group">
           {selectedImage ? (
             <img
-              src={data?.image_with_boxes ? data.image_with_boxes : selectedImage}
+              src={getAnnotatedImageSrc(data) ?? selectedImage}
               className="w-full h-full object-contain"
               alt="Source"
               onError={(e) => {
@@ -380,7 +381,7 @@ const DetectionPlayground = () => {
                       ) : (
                         filteredResult?.[m as Model] ? (
                           <img
-                            src={filteredResult[m as Model]!.image_with_boxes}
+                            src={getAnnotatedImageSrc(filteredResult[m as Model])}
                             className="w-full h-full object-contain animate-fade-in"
                             alt="Detection Result"
                           />
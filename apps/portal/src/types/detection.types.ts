@@ -9,7 +9,8 @@ export interface ModelResult {
     inference_time_ms: number;
     num_objects: number;
     avg_confidence: number;
-    image_with_boxes: string; // Base64 string
+    image_with_boxes?: string; // Base64 data URI (Flask app)
+    image_with_boxes_url?: string; // /static URL (FastAPI)
 }
 
 export interface DetectionResponse {
@@ -1,9 +1,20 @@
 import axios from 'axios';
-import { HealthStatus, MetricsResponse, DetectionResponse } from '../types/detection.types';
+import { HealthStatus, MetricsResponse, DetectionResponse, ModelResult } from '../types/detection.types';
 
 // Use proxy in development, direct URL in production
 const API_BASE_URL = import.meta.env.PROD ? 'http://localhost:8000/api' : '/api';
 
+// Origin that serves /static in production (dev goes through the Vite proxy)
+const ASSET_ORIGIN = import.meta.env.PROD ? 'http://localhost:8000' : '';
+
+// FastAPI returns annotated images as a /static URL; the Flask app still inlines a data URI
+export const getAnnotatedImageSrc = (result?: ModelResult): string | undefined => {
+    if (result?.image_with_boxes_url) {
+        return `${ASSET_ORIGIN}${result.image_with_boxes_url}`;
+    }
+    return result?.image_with_boxes;
+};
+
 const api = axios.create({
     baseURL: API_BASE_URL,
     headers: {
@@ -52,6 +63,8 @@ export const runDetection = async (
         model,
         conf_threshold: confThreshold,
         iou_threshold: iouThreshold,
+        // Annotated images by /static URL only; skips the inline base64 copy
+        image_format: 'url',
     });
     return response.data;
 };
@@ -76,6 +89,7 @@ export interface SubsetEvalResult {
     mAP_50: number;
     per_class_ap: Record<string, number>;
     avg_latency_ms: number;
+    amortized_ms_per_image: number;
     total_time_s: number;
 }
 
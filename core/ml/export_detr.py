@@ -0,0 +1,55 @@
+"""
+DETR ONNX Runtime INT8 Export
+Dynamic INT8 quantization of the DETR ONNX graph for CPU-only API hosts.
+The API picks up detr_int8.onnx automatically when it runs without a GPU.
+"""
+
+import os
+from pathlib import Path
+
+from export_tensorrt import DETR_ONNX, export_detr_onnx
+
+ML_DIR = Path(__file__).parent
+DETR_ONNX_INT8 = ML_DIR / "detr_int8.onnx"
+
+
+def quantize_detr_int8(onnx_path=DETR_ONNX, output=DETR_ONNX_INT8):
+    """
+    Quantize the transformer's MatMul/Gemm weights to INT8 (activations quantized at runtime).
+
+    The ResNet backbone convs stay FP32: dynamic quantization would turn them into
+    ConvInteger, which ONNX Runtime's CPU provider runs no faster than its FP32 convs.
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    if not os.path.exists(onnx_path):
+        export_detr_onnx(output=onnx_path)
+
+    print(f"🔧 Quantizing {onnx_path} to INT8...")
+    quantize_dynamic(
+        str(onnx_path),
+        str(output),
+        weight_type=QuantType.QInt8,
+        op_types_to_quantize=["MatMul", "Gemm"],
+    )
+    print(f"✅ DETR INT8 ONNX saved: {output}")
+    return output
+
+
+def main():
+    """Main export entry point"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Export DETR to a dynamic-INT8 ONNX model for CPU inference')
+    parser.add_argument('--onnx', type=str, default=str(DETR_ONNX),
+                        help='FP32 ONNX export to quantize (exported first if missing)')
+    parser.add_argument('--output', type=str, default=str(DETR_ONNX_INT8),
+                        help='Where to write the INT8 model')
+
+    args = parser.parse_args()
+    quantize_detr_int8(args.onnx, args.output)
+    print("\n🚀 Restart the API (on a CPU host) to pick up the INT8 model.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+TensorRT Export Script
+Builds the inference engines picked up by the API detectors:
+  - YOLOv5 -> INT8 engine, entropy-calibrated on Pascal VOC frames
+  - YOLOv5 -> FP16 engine with NMS fused in (EfficientNMS_TRT plugin)
+  - DETR   -> FP16 engine (transformer blocks lose too much accuracy under INT8)
+"""
+
+import os
+import shutil
+import subprocess
+import torch
+import torch.nn as nn
+from pathlib import Path
+
+ML_DIR = Path(__file__).parent
+YOLO_WEIGHTS = ML_DIR / "yolov5su.pt"
+YOLO_ENGINE = ML_DIR / "yolov5su_int8.engine"
+YOLO_NMS_ONNX = ML_DIR / "yolov5su_nms.onnx"
+YOLO_NMS_ENGINE = ML_DIR / "yolov5su_nms_fp16.engine"
+DETR_NAME = "facebook/detr-resnet-50"
+DETR_ONNX = ML_DIR / "detr.onnx"
+DETR_ENGINE = ML_DIR / "detr_fp16.engine"
+
+# DetrImageProcessor resizes the shortest edge to 800 and caps the longest at 1333
+DETR_MIN_SIDE, DETR_OPT_SHAPE, DETR_MAX_SIDE = 320, (800, 1066), 1333
+
+
+def export_yolo_int8(weights=YOLO_WEIGHTS, data_yaml=ML_DIR / "voc_data.yaml",
+                     output=YOLO_ENGINE, img_size=640, batch=8, calib_fraction=0.05):
+    """
+    Export YOLOv5 to an INT8 TensorRT engine.
+
+    Ultralytics runs the ONNX export and the entropy calibrator itself; ``calib_fraction``
+    of the VOC val split (~300 frames at the default) is used as calibration data.
+    """
+    from ultralytics import YOLO
+
+    print(f"🔧 Exporting YOLOv5 INT8 engine from {weights}...")
+    engine = YOLO(str(weights)).export(
+        format="engine",
+        int8=True,
+        data=str(data_yaml),
+        fraction=calib_fraction,
+        imgsz=img_size,
+        dynamic=True,
+        batch=batch,
+        device=0,
+    )
+    shutil.move(str(engine), str(output))
+    print(f"✅ YOLOv5 engine saved: {output}")
+    return output
+
+
+def export_yolo_nms_onnx(weights=YOLO_WEIGHTS, output=YOLO_NMS_ONNX, img_size=640,
+                         iou_threshold=0.45, score_threshold=0.001, max_det=300):
+    """
+    Export YOLOv5 to ONNX and append an EfficientNMS_TRT node, so box decode + NMS run
+    inside the engine and it returns (num_dets, det_boxes, det_scores, det_classes).
+
+    The IoU threshold is baked into the plugin; the API only takes the fused path for
+    requests at that IoU. ``score_threshold`` stays low so the per-request confidence
+    can be applied on top of the ``max_det`` highest-scoring boxes.
+    """
+    import numpy as np
+    import onnx
+    import onnx_graphsurgeon as gs
+    from ultralytics import YOLO
+
+    print(f"🔧 Exporting YOLOv5 ONNX from {weights}...")
+    raw = YOLO(str(weights)).export(format="onnx", imgsz=img_size, dynamic=True, simplify=True)
+    graph = gs.import_onnx(onnx.load(str(raw)))
+
+    # Ultralytics head output: (batch, 4 + classes, anchors) with boxes as cx, cy, w, h
+    preds = graph.outputs[0]
+    n_classes = preds.shape[1] - 4
+    transposed = gs.Variable("preds_t", dtype=np.float32)
+    graph.nodes.append(gs.Node("Transpose", inputs=[preds], outputs=[transposed], attrs={"perm": [0, 2, 1]}))
+
+    def channels(name, start, end):
+        out = gs.Variable(name, dtype=np.float32)
+        consts = [gs.Constant(f"{name}_{k}", np.array([v], dtype=np.int64))
+                  for k, v in (("starts", start), ("ends", end), ("axes", 2))]
+        graph.nodes.append(gs.Node("Slice", inputs=[transposed, *consts], outputs=[out]))
+        return out
+
+    boxes = channels("boxes", 0, 4)
+    scores = channels("scores", 4, 4 + n_classes)
+
+    batch = preds.shape[0]
+    outputs = [
+        gs.Variable("num_dets", dtype=np.int32, shape=[batch, 1]),
+        gs.Variable("det_boxes", dtype=np.float32, shape=[batch, max_det, 4]),
+        gs.Variable("det_scores", dtype=np.float32, shape=[batch, max_det]),
+        gs.Variable("det_classes", dtype=np.int32, shape=[batch, max_det]),
+    ]
+    graph.nodes.append(gs.Node(
+        "EfficientNMS_TRT",
+        inputs=[boxes, scores],
+        outputs=outputs,
+        attrs={
+            "plugin_version": "1",
+            "background_class": -1,
+            "max_output_boxes": max_det,
+            "score_threshold": score_threshold,
+            "iou_threshold": iou_threshold,
+            "score_activation": 0,  # the head already applies sigmoid
+            "class_agnostic": 0,    # per-class NMS, like ultralytics' default
+            "box_coding": 1,        # center-size boxes
+        },
+    ))
+    graph.outputs = outputs
+    graph.cleanup().toposort()
+    onnx.save(gs.export_onnx(graph), str(output))
+    print(f"✅ YOLOv5 NMS ONNX saved: {output}")
+    return output
+
+
+def build_yolo_nms_engine_fp16(onnx_path=YOLO_NMS_ONNX, output=YOLO_NMS_ENGINE, img_size=640, batch=8):
+    """Compile the NMS-fused YOLO graph to an FP16 engine (fixed 640x640 letterboxed input)."""
+    def shapes(b):
+        return f"images:{b}x3x{img_size}x{img_size}"
+
+    cmd = [
+        "trtexec",
+        f"--onnx={onnx_path}",
+        "--fp16",
+        f"--saveEngine={output}",
+        f"--minShapes={shapes(1)}",
+        f"--optShapes={shapes(1)}",
+        f"--maxShapes={shapes(batch)}",
+    ]
+    print(f"🔧 Building YOLOv5 NMS engine: {' '.join(cmd)}")
+    subprocess.run(cmd, check=True)
+    print(f"✅ YOLOv5 NMS engine saved: {output}")
+    return output
+
+
+class _DetrExportWrapper(nn.Module):
+    """Return plain tensors so the ONNX graph has named outputs."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values, pixel_mask):
+        outputs = self.model(pixel_values=pixel_values, pixel_mask=pixel_mask)
+        return outputs.logits, outputs.pred_boxes
+
+
+def export_detr_onnx(model_name=DETR_NAME, output=DETR_ONNX, opset=17):
+    """Export DETR to ONNX with dynamic batch and spatial dimensions."""
+    from transformers import DetrForObjectDetection
+
+    print(f"🔧 Exporting {model_name} to ONNX...")
+    model = DetrForObjectDetection.from_pretrained(model_name).eval()
+    h, w = DETR_OPT_SHAPE
+    dummy_pixels = torch.zeros(1, 3, h, w)
+    dummy_mask = torch.ones(1, h, w, dtype=torch.int64)
+
+    torch.onnx.export(
+        _DetrExportWrapper(model),
+        (dummy_pixels, dummy_mask),
+        str(output),
+        opset_version=opset,
+        input_names=["pixel_values", "pixel_mask"],
+        output_names=["logits", "pred_boxes"],
+        dynamic_axes={
+            "pixel_values": {0: "batch", 2: "height", 3: "width"},
+            "pixel_mask": {0: "batch", 1: "height", 2: "width"},
+            "logits": {0: "batch"},
+            "pred_boxes": {0: "batch"},
+        },
+    )
+    print(f"✅ DETR ONNX saved: {output}")
+    return output
+
+
+def build_detr_engine_fp16(onnx_path=DETR_ONNX, output=DETR_ENGINE, batch=8):
+    """Compile the DETR ONNX graph to an FP16 engine with trtexec."""
+    h, w = DETR_OPT_SHAPE
+    lo, hi = DETR_MIN_SIDE, DETR_MAX_SIDE
+
+    def shapes(b, sh, sw):
+        return f"pixel_values:{b}x3x{sh}x{sw},pixel_mask:{b}x{sh}x{sw}"
+
+    cmd = [
+        "trtexec",
+        f"--onnx={onnx_path}",
+        "--fp16",
+        f"--saveEngine={output}",
+        f"--minShapes={shapes(1, lo, lo)}",
+        f"--optShapes={shapes(1, h, w)}",
+        f"--maxShapes={shapes(batch, hi, hi)}",
+    ]
+    print(f"🔧 Building DETR FP16 engine: {' '.join(cmd)}")
+    subprocess.run(cmd, check=True)
+    print(f"✅ DETR engine saved: {output}")
+    return output
+
+
+def main():
+    """Main export entry point"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Export YOLOv5/DETR to TensorRT engines')
+    parser.add_argument('--model', type=str, default='both', choices=['yolov5', 'detr', 'both'],
+                        help='Which detector to export')
+    parser.add_argument('--batch', type=int, default=int(os.getenv("MAX_BATCH_SIZE", 8)),
+                        help='Largest batch the engines must accept (match the API batcher)')
+    parser.add_argument('--calib-fraction', type=float, default=0.05,
+                        help='Fraction of VOC val images used for INT8 calibration')
+
+    args = parser.parse_args()
+
+    if not torch.cuda.is_available():
+        print("❌ TensorRT export requires a CUDA device.")
+        return
+
+    if args.model in ['yolov5', 'both']:
+        export_yolo_int8(batch=args.batch, calib_fraction=args.calib_fraction)
+        export_yolo_nms_onnx()
+        build_yolo_nms_engine_fp16(batch=args.batch)
+
+    if args.model in ['detr', 'both']:
+        export_detr_onnx()
+        build_detr_engine_fp16(batch=args.batch)
+
+    print("\n🚀 Restart the API to pick up the new engines.")
+
+
+if __name__ == "__main__":
+    main()
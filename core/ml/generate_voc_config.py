@@ -57,6 +57,12 @@ names:
     return output_file
 
 
+def _count_files(directory: Path, suffix: str) -> int:
+    """Count files by suffix straight off scandir's DirEntry (no Path objects, no extra stat)."""
+    with os.scandir(directory) as entries:
+        return sum(1 for e in entries if e.name.endswith(suffix) and e.is_file())
+
+
 def verify_voc_dataset():
     """Verify that VOC dataset exists and is properly structured"""
     required_dirs = [
@@ -81,13 +87,13 @@ def verify_voc_dataset():
         # Count images
         jpeg_dir = VOC_ROOT / "JPEGImages"
         if jpeg_dir.exists():
-            num_images = len(list(jpeg_dir.glob("*.jpg")))
+            num_images = _count_files(jpeg_dir, ".jpg")
             print(f"📸 Total images: {num_images}")
         
         # Count annotations
         ann_dir = VOC_ROOT / "Annotations"
         if ann_dir.exists():
-            num_annotations = len(list(ann_dir.glob("*.xml")))
+            num_annotations = _count_files(ann_dir, ".xml")
             print(f"📝 Total annotations: {num_annotations}")
     else:
         print("\n❌ VOC dataset is incomplete!")
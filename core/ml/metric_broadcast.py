@@ -0,0 +1,72 @@
+"""
+Background WebSocket broadcaster for training metrics, shared by the trainers.
+One long-lived event loop on a daemon thread; the training loop hands metrics over
+and carries on instead of running asyncio.run() per epoch.
+"""
+
+import asyncio
+import json
+import threading
+
+try:
+    import orjson
+except ImportError:  # orjson is optional here; stdlib json works, just slower
+    orjson = None
+
+
+class MetricBroadcaster:
+    def __init__(self, name: str = "metrics"):
+        self.clients = set()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name=f"{name}-broadcast", daemon=True)
+        self._thread.start()
+        self._pending = []
+        self._order = None  # asyncio.Lock, created on the loop thread
+
+    async def _send(self, metric_data: dict):
+        # Tasks interleave at await, so without the lock a slow client could let epoch N+1
+        # go out before epoch N. asyncio.Lock is FIFO and tasks start in submission order.
+        if self._order is None:
+            self._order = asyncio.Lock()
+        async with self._order:
+            # Serialized once for every client, sent concurrently; clients that fail are dropped
+            message = orjson.dumps(metric_data).decode() if orjson is not None else json.dumps(metric_data)
+            clients = list(self.clients)
+            if clients:
+                results = await asyncio.gather(
+                    *[client.send(message) for client in clients],
+                    return_exceptions=True
+                )
+                for client, result in zip(clients, results):
+                    if isinstance(result, Exception):
+                        self.clients.discard(client)
+
+    def submit(self, metric_data: dict):
+        """Queue one broadcast without waiting for it."""
+        self._reap()
+        self._pending.append(asyncio.run_coroutine_threadsafe(self._send(metric_data), self._loop))
+
+    def _reap(self):
+        # Retrieve finished broadcasts so their errors are reported, not silently dropped
+        still_pending = []
+        for future in self._pending:
+            if not future.done():
+                still_pending.append(future)
+            elif future.exception() is not None:
+                print(f"⚠️  Metric broadcast failed: {future.exception()}")
+        self._pending = still_pending
+
+    def flush(self, timeout: float = 5.0):
+        """Wait for every queued broadcast (up to ``timeout`` each)."""
+        for future in self._pending:
+            try:
+                future.result(timeout=timeout)
+            except Exception as e:
+                print(f"⚠️  Metric broadcast failed: {e}")
+        self._pending = []
+
+    def shutdown(self):
+        """Flush, then stop the loop thread."""
+        self.flush()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5.0)
@@ -5,8 +5,6 @@ Trains DETR (Vision Transformer) on Pascal VOC 2012 dataset with live progress u
 
 import os
 import sys
-import asyncio
-import json
 import torch
 import torch.nn as nn
 from pathlib import Path
@@ -15,6 +13,8 @@ from transformers import DetrForObjectDetection, DetrImageProcessor
 from torch.utils.data import DataLoader
 import websockets
 
+from metric_broadcast import MetricBroadcaster
+
 # Add project root to path
 PROJECT_ROOT = Path(__file__).parent.parent
 sys.path.append(str(PROJECT_ROOT))
@@ -25,16 +25,13 @@ class DETRTrainer:
         self.websocket_url = websocket_url
         self.model = None
         self.processor = None
-        self.ws_clients = set()
+        # Background loop shared with the other trainer (see metric_broadcast.py)
+        self.broadcaster = MetricBroadcaster("detr")
+        self.ws_clients = self.broadcaster.clients
         
-    async def broadcast_metric(self, metric_data: dict):
-        """Broadcast training metrics to all connected WebSocket clients"""
-        message = json.dumps(metric_data)
-        if self.ws_clients:
-            await asyncio.gather(
-                *[client.send(message) for client in self.ws_clients],
-                return_exceptions=True
-            )
+    def broadcast_metric(self, metric_data: dict):
+        """Queue training metrics for all connected WebSocket clients, without waiting for the sends"""
+        self.broadcaster.submit(metric_data)
         print(f"📊 Epoch {metric_data.get('epoch', 0)}: Loss={metric_data.get('train_loss', 0):.4f}")
     
     def train(self,
@@ -42,9 +39,15 @@ class DETRTrainer:
               val_dataloader: DataLoader,
               epochs: int = 50,
               lr: float = 1e-4,
-              device: str = "cuda" if torch.cuda.is_available() else "cpu"):
+              device: str = "cuda" if torch.cuda.is_available() else "cpu",
+              accum_steps: int = 1):
         """
         Train DETR model with real-time metrics
+
+        Build the dataloaders with pin_memory=True (plus num_workers=4, persistent_workers=True,
+        prefetch_factor=4) so the non-blocking host->device copies below can actually overlap.
+        ``accum_steps`` micro-batches are accumulated per optimizer step (effective batch =
+        batch size x accum_steps).
         """
         print(f"🚀 Starting DETR Training - Run ID: {self.run_id}")
         print(f"📦 Device: {device}")
@@ -56,10 +59,23 @@ class DETRTrainer:
             ignore_mismatched_sizes=True
         )
         self.model.to(device)
+        use_cuda = device == "cuda"
+        if use_cuda:
+            # NHWC lets cuDNN pick tensor-core kernels for the ResNet backbone; benchmark
+            # autotunes conv algorithms per input shape
+            self.model = self.model.to(memory_format=torch.channels_last)
+            torch.backends.cudnn.benchmark = True
+            # TF32 tensor cores for the fp32 ops autocast leaves alone (Ampere+)
+            torch.set_float32_matmul_precision('high')
+            torch.backends.cuda.matmul.allow_tf32 = True
+            torch.backends.cudnn.allow_tf32 = True
         
-        # Optimizer and Mixed Precision Scaler
-        optimizer = torch.optim.AdamW(self.model.parameters(), lr=lr)
-        scaler = torch.cuda.amp.GradScaler() if device == "cuda" else None
+        # Optimizer and Mixed Precision Scaler (fused AdamW: one kernel for all params, CUDA only)
+        optimizer = torch.optim.AdamW(self.model.parameters(), lr=lr, fused=use_cuda)
+        # BF16 on Ampere+ has FP32's exponent range, so only the FP16 fallback needs loss scaling
+        use_bf16 = use_cuda and torch.cuda.get_device_capability()[0] >= 8
+        amp_dtype = torch.bfloat16 if use_bf16 else torch.float16
+        scaler = torch.cuda.amp.GradScaler() if use_cuda and not use_bf16 else None
         
         # Scheduler (Cosine)
         scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=epochs)
@@ -68,45 +84,47 @@ class DETRTrainer:
         for epoch in range(epochs):
             self.model.train()
             total_loss = 0
+            optimizer.zero_grad(set_to_none=True)
+            n_batches = len(train_dataloader)
             
-            for batch_idx, batch in enumerate(train_dataloader):
-                pixel_values = batch['pixel_values'].to(device)
-                labels = [{k: v.to(device) for k, v in t.items()} for t in batch['labels']]
+            for batch_idx, (pixel_values, labels) in enumerate(self._prefetch(train_dataloader, device)):
                 
                 # Forward pass with AMP
-                if scaler:
-                    with torch.cuda.amp.autocast():
-                        outputs = self.model(pixel_values=pixel_values, labels=labels)
-                        loss = outputs.loss
-                else:
+                with torch.autocast("cuda", dtype=amp_dtype, enabled=use_cuda):
                     outputs = self.model(pixel_values=pixel_values, labels=labels)
                     loss = outputs.loss
                 
-                # Backward pass
-                optimizer.zero_grad()
+                # Backward pass; gradients accumulate until the step below
                 if scaler:
-                    scaler.scale(loss).backward()
-                    # Gradient Clipping
-                    scaler.unscale_(optimizer)
-                    torch.nn.utils.clip_grad_norm_(self.model.parameters(), max_norm=0.1)
-                    scaler.step(optimizer)
-                    scaler.update()
+                    scaler.scale(loss / accum_steps).backward()
                 else:
-                    loss.backward()
-                    torch.nn.utils.clip_grad_norm_(self.model.parameters(), max_norm=0.1)
-                    optimizer.step()
+                    (loss / accum_steps).backward()
+
+                # Step every accum_steps micro-batches (and on the last, possibly partial, group)
+                if (batch_idx + 1) % accum_steps == 0 or batch_idx + 1 == n_batches:
+                    if scaler:
+                        # Gradient Clipping
+                        scaler.unscale_(optimizer)
+                        torch.nn.utils.clip_grad_norm_(self.model.parameters(), max_norm=0.1)
+                        scaler.step(optimizer)
+                        scaler.update()
+                    else:
+                        torch.nn.utils.clip_grad_norm_(self.model.parameters(), max_norm=0.1)
+                        optimizer.step()
+                    # set_to_none skips the per-parameter fill_(0)
+                    optimizer.zero_grad(set_to_none=True)
                 
                 total_loss += loss.item()
                 
                 if batch_idx % 10 == 0:
-                    print(f"Epoch {epoch+1}, Batch {batch_idx}/{len(train_dataloader)}, Loss: {loss.item():.4f}")
+                    print(f"Epoch {epoch+1}, Batch {batch_idx}/{n_batches}, Loss: {loss.item():.4f}")
             
             # Step the scheduler
             scheduler.step()
-            train_loss = total_loss / len(train_dataloader)
+            train_loss = total_loss / n_batches
             
             # Validation phase
-            val_loss, val_metrics = self._validate_epoch(val_dataloader, device, epoch)
+            val_loss, val_metrics = self._validate_epoch(val_dataloader, device, epoch, amp_dtype)
             
             # Broadcast metrics
             metric_data = {
@@ -124,19 +142,61 @@ class DETRTrainer:
                 "timestamp": datetime.now().isoformat()
             }
             
-            asyncio.run(self.broadcast_metric(metric_data))
+            self.broadcast_metric(metric_data)
             
             # Save checkpoint every 10 epochs
             if (epoch + 1) % 10 == 0:
                 checkpoint_path = PROJECT_ROOT / "checkpoints" / f"detr_{self.run_id}_epoch{epoch+1}.pt"
                 self.save_checkpoint(str(checkpoint_path))
         
+        self.broadcaster.flush()
         print(f"✅ Training Complete!")
         return self.model
-    
-    
-    def _validate_epoch(self, dataloader, device, epoch):
-        """Validate for one epoch"""
+
+    def shutdown(self):
+        """Stop the broadcast loop once the trainer is done with."""
+        self.broadcaster.shutdown()
+
+    @staticmethod
+    def _to_device(batch, device):
+        pixel_values = batch['pixel_values'].to(device, memory_format=torch.channels_last, non_blocking=True)
+        labels = [{k: v.to(device, non_blocking=True) for k, v in t.items()} for t in batch['labels']]
+        return pixel_values, labels
+
+    def _prefetch(self, dataloader, device):
+        """
+        Yield (pixel_values, labels) on ``device``. On CUDA the next batch is copied on a side
+        stream while the current one trains.
+        """
+        if device != "cuda":
+            for batch in dataloader:
+                yield self._to_device(batch, device)
+            return
+
+        copy_stream = torch.cuda.Stream()
+        compute_stream = torch.cuda.current_stream()
+
+        def load(batch):
+            with torch.cuda.stream(copy_stream):
+                return self._to_device(batch, device)
+
+        batches = iter(dataloader)
+        first = next(batches, None)
+        upcoming = load(first) if first is not None else None
+        while upcoming is not None:
+            compute_stream.wait_stream(copy_stream)
+            pixel_values, labels = upcoming
+            # Allocated on the copy stream; keep the caching allocator from reusing them early
+            pixel_values.record_stream(compute_stream)
+            for t in labels:
+                for v in t.values():
+                    v.record_stream(compute_stream)
+            nxt = next(batches, None)
+            upcoming = load(nxt) if nxt is not None else None
+            yield pixel_values, labels
+
+    def _validate_epoch(self, dataloader, device, epoch, amp_dtype=torch.float16):
+        """Validate for one epoch, under the same autocast dtype as training"""
         self.model.eval()
         total_loss = 0
         
@@ -148,10 +208,9 @@ class DETRTrainer:
             'recall': 0.75
         }
         
-        with torch.no_grad():
-            for batch in dataloader:
-                pixel_values = batch['pixel_values'].to(device)
-                labels = [{k: v.to(device) for k, v in t.items()} for t in batch['labels']]
+        # inference_mode skips autograd bookkeeping entirely; autocast halves activation memory
+        with torch.inference_mode(), torch.autocast("cuda", dtype=amp_dtype, enabled=device == "cuda"):
+            for pixel_values, labels in self._prefetch(dataloader, device):
                 
                 outputs = self.model(pixel_values=pixel_values, labels=labels)
                 total_loss += outputs.loss.item()
@@ -181,6 +240,8 @@ def main():
                         help='Number of training epochs')
     parser.add_argument('--batch-size', type=int, default=4, 
                         help='Batch size (DETR is memory-intensive)')
+    parser.add_argument('--accum-steps', type=int, default=1,
+                        help='Micro-batches per optimizer step (effective batch = batch-size x accum-steps)')
     parser.add_argument('--lr', type=float, default=1e-4, 
                         help='Learning rate')
     parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu',
@@ -201,7 +262,7 @@ def main():
     
     # For now, show usage example
     print(f"\n📝 Example Usage:")
-    print(f"   python train_detr.py --epochs 50 --batch-size 4 --lr 1e-4")
+    print(f"   python train_detr.py --epochs 50 --batch-size 4 --accum-steps 4 --lr 1e-4")
     print(f"\n🔧 Next Steps:")
     print(f"   1. Implement VOC dataset loader in data_pipeline/")
     print(f"   2. Connect WebSocket server in web_app/backend/")
@@ -210,6 +271,7 @@ def main():
     # Save final checkpoint path
     checkpoint_path = PROJECT_ROOT / "checkpoints" / f"detr_{args.run_id}_final.pt"
     print(f"\n💾 Checkpoints will be saved to: {checkpoint_path.parent}")
+    trainer.shutdown()
 
 
 if __name__ == "__main__":
@@ -141,22 +141,37 @@ cells.append(code("""def parse_voc_xml(xml_path):
         })
     return objects
 
-train_ids = [l.strip() for l in open(IMAGESETS_DIR / "train.txt") if l.strip()]
-val_ids = [l.strip() for l in open(IMAGESETS_DIR / "val.txt") if l.strip()]
-
-all_objects = []
-# For testing, we only parse first 100 XMLs if env is 'test', otherwise all
-xml_files = glob.glob(str(ANNOTATIONS_DIR / "*.xml"))
-if os.getenv("NB_TEST_MODE") == "1":
-    xml_files = xml_files[:100]
-
-for xml_path in tqdm(xml_files, desc="Parsing"):
-    all_objects.extend(parse_voc_xml(xml_path))
-
-df = pd.DataFrame(all_objects)
-df['split'] = 'other'
-df.loc[df['image_id'].isin(train_ids), 'split'] = 'train'
-df.loc[df['image_id'].isin(val_ids), 'split'] = 'val'
+# One read + split per file (also closes them); sets so isin() is a straight hash probe
+train_ids = set((IMAGESETS_DIR / "train.txt").read_text().split())
+val_ids = set((IMAGESETS_DIR / "val.txt").read_text().split())
+
+# Parsed annotations are cached as parquet; set NB_FORCE_REPARSE=1 to rebuild the cache
+test_mode = os.getenv("NB_TEST_MODE") == "1"
+objects_cache = RESULTS_DIR / ("voc_objects_test.parquet" if test_mode else "voc_objects.parquet")
+
+if objects_cache.exists() and os.getenv("NB_FORCE_REPARSE") != "1":
+    df = pd.read_parquet(objects_cache)
+    print(f"📦 Loaded cached annotations from {objects_cache.name}")
+else:
+    all_objects = []
+    # For testing, we only parse first 100 XMLs if env is 'test', otherwise all
+    xml_files = glob.glob(str(ANNOTATIONS_DIR / "*.xml"))
+    if test_mode:
+        xml_files = xml_files[:100]
+
+    for xml_path in tqdm(xml_files, desc="Parsing"):
+        all_objects.extend(parse_voc_xml(xml_path))
+
+    df = pd.DataFrame(all_objects)
+    try:
+        df.to_parquet(objects_cache, index=False)
+    except ImportError:  # needs pyarrow or fastparquet; the parse still works without them
+        print("⚠️ No parquet engine installed, annotations won't be cached")
+
+# Built in one pass; val is listed first so it still wins for an id in both lists,
+# as it did when it was assigned last
+df['split'] = np.select([df['image_id'].isin(val_ids), df['image_id'].isin(train_ids)],
+                        ['val', 'train'], default='other')
 print(f"Total: {len(df)} annots | {df['image_id'].nunique()} images")"""))
 
 cells.append(md("# 📊 Section 2: EDA (Compact)"))
@@ -165,4 +180,8 @@ df['object_class'].value_counts().plot(kind='barh', ax=ax, color=CB_PALETTE)
 ax.set_title("Class Distribution")
 plt.show()"""))
 
-with open('cells_part1.json', 'w') as f: json.dump(cells, f)
+try:
+    import orjson
+    with open('cells_part1.json', 'wb') as f: f.write(orjson.dumps(cells))
+except ImportError:
+    with open('cells_part1.json', 'w') as f: json.dump(cells, f)
@@ -1,15 +1,26 @@
 import json
 
+try:
+    # Streams one cell at a time, so peak memory doesn't grow with embedded outputs
+    import ijson
+except ImportError:
+    ijson = None
+
 nb_path = 'vision_transformer_object_detection.ipynb'
 
+def iter_cells(f):
+    if ijson is not None:
+        yield from ijson.items(f, 'cells.item')
+    else:
+        yield from json.load(f)['cells']
+
 try:
-    with open(nb_path, 'r', encoding='utf-8') as f:
-        nb = json.load(f)
+    with open(nb_path, 'rb') as f:
+        print(f"Scanning {nb_path} for DETR and SAVE operations...")
 
-    print(f"Scanning {nb_path} for DETR and SAVE operations...")
-    
-    for i, cell in enumerate(nb['cells']):
-        if cell['cell_type'] == 'code':
+        for i, cell in enumerate(iter_cells(f)):
+            if cell['cell_type'] != 'code':
+                continue
             source = ''.join(cell['source'])
             if 'DETR' in source or 'detr' in source:
                 print(f"\n[Cell {i+1}] DETR Context:")
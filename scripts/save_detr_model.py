@@ -2,14 +2,26 @@ from transformers import DetrForObjectDetection
 import torch
 import os
 
+try:
+    # Ships with transformers; no pickle on load and tensors are memory-mapped
+    from safetensors.torch import save_file
+except ImportError:
+    save_file = None
+
 save_path = "transformer-vs-cnn/backend/models/detr_model.pt"
+if save_file is not None:
+    save_path = os.path.splitext(save_path)[0] + ".safetensors"
 
 print("Downloading DETR model (facebook/detr-resnet-50)...")
 try:
     model = DetrForObjectDetection.from_pretrained("facebook/detr-resnet-50")
     
     print(f"Saving model state_dict to {save_path}...")
-    torch.save(model.state_dict(), save_path)
+    if save_file is not None:
+        # safetensors wants contiguous tensors
+        save_file({k: v.contiguous() for k, v in model.state_dict().items()}, save_path)
+    else:
+        torch.save(model.state_dict(), save_path)
     
     print("✅ DETR model saved successfully!")
     
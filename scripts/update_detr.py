@@ -1,18 +1,33 @@
 import json
 import os
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 notebook_path = 'vision_transformer_object_detection.ipynb'
 
 try:
-    with open(notebook_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    if orjson is not None:
+        with open(notebook_path, 'rb') as f:
+            data = orjson.loads(f.read())
+    else:
+        with open(notebook_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
     
     # Cell 19 (index 18) is the DETR Initialize & Training loop placeholder
     cell_index = 18
     
     optimized_code = [
         "from torch.utils.data import DataLoader\n",
-        "from torch.cuda.amp import autocast, GradScaler\n",
+        "from torch.cuda.amp import GradScaler\n",
+        "\n",
+        "# TF32 for fp32 matmuls/convs on Ampere+, cuDNN autotuning for the fixed input size\n",
+        "torch.set_float32_matmul_precision('high')\n",
+        "torch.backends.cuda.matmul.allow_tf32 = True\n",
+        "torch.backends.cudnn.allow_tf32 = True\n",
+        "torch.backends.cudnn.benchmark = True\n",
         "\n",
         "def collate_fn(batch):\n",
         "    return tuple(zip(*batch))\n",
@@ -24,37 +39,56 @@ try:
         "train_dataset = VOCDetectionDataset(train_df, VOC_ROOT/\"JPEGImages\", transform=get_transforms(train=True))\n",
         "val_dataset = VOCDetectionDataset(val_df, VOC_ROOT/\"JPEGImages\", transform=get_transforms(train=False))\n",
         "\n",
-        "train_loader = DataLoader(train_dataset, batch_size=4, shuffle=True, collate_fn=collate_fn, num_workers=2)\n",
-        "val_loader = DataLoader(val_dataset, batch_size=4, shuffle=False, collate_fn=collate_fn, num_workers=2)\n",
+        "# Pinned host batches let the non_blocking copies below overlap with compute;\n",
+        "# persistent workers skip re-forking every epoch\n",
+        "loader_kwargs = dict(pin_memory=True, persistent_workers=True, prefetch_factor=4)\n",
+        "train_loader = DataLoader(train_dataset, batch_size=4, shuffle=True, collate_fn=collate_fn, num_workers=2, **loader_kwargs)\n",
+        "val_loader = DataLoader(val_dataset, batch_size=4, shuffle=False, collate_fn=collate_fn, num_workers=2, **loader_kwargs)\n",
+        "\n",
+        "# BF16 on Ampere+ keeps FP32's exponent range, so it needs no loss scaling (scaler=None)\n",
+        "USE_BF16 = torch.cuda.is_available() and torch.cuda.get_device_capability()[0] >= 8\n",
+        "AMP_DTYPE = torch.bfloat16 if USE_BF16 else torch.float16\n",
+        "# Gradient accumulation: effective batch = 4 x ACCUM_STEPS = 16 without the memory of batch 16\n",
+        "ACCUM_STEPS = 4\n",
         "\n",
-        "def train_detr_epoch(model, loader, optimizer, scaler, device):\n",
+        "def train_detr_epoch(model, loader, optimizer, scaler, device, accum_steps=ACCUM_STEPS):\n",
         "    model.train()\n",
         "    total_loss = 0\n",
         "    pbar = tqdm(loader, desc=\"Training DETR\")\n",
         "    \n",
-        "    for images, targets in pbar:\n",
-        "        images = list(img.to(device) for img in images)\n",
+        "    optimizer.zero_grad(set_to_none=True)\n",
+        "    for step, (images, targets) in enumerate(pbar):\n",
+        "        images = list(img.to(device, non_blocking=True) for img in images)\n",
         "        \n",
         "        processed_targets = []\n",
         "        for t in targets:\n",
-        "            d = {k: v.to(device) for k, v in t.items()}\n",
+        "            d = {k: v.to(device, non_blocking=True) for k, v in t.items()}\n",
         "            processed_targets.append(d)\n",
-        "            \n",
-        "        optimizer.zero_grad()\n",
         "        \n",
         "        # AMP autocast\n",
-        "        with autocast():\n",
-        "            outputs = model(pixel_values=torch.stack(images), labels=processed_targets)\n",
+        "        with torch.amp.autocast('cuda', dtype=AMP_DTYPE):\n",
+        "            pixel_values = torch.stack(images).to(memory_format=torch.channels_last)\n",
+        "            outputs = model(pixel_values=pixel_values, labels=processed_targets)\n",
         "            loss = outputs.loss\n",
         "            \n",
-        "        scaler.scale(loss).backward()\n",
+        "        # Loss is averaged over the accumulation window; grads pile up until the step below\n",
+        "        if scaler is not None:\n",
+        "            scaler.scale(loss / accum_steps).backward()\n",
+        "        else:\n",
+        "            (loss / accum_steps).backward()\n",
         "        \n",
-        "        # Gradient Clipping\n",
-        "        scaler.unscale_(optimizer)\n",
-        "        torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=0.1)\n",
-        "        \n",
-        "        scaler.step(optimizer)\n",
-        "        scaler.update()\n",
+        "        # Step every accum_steps micro-batches (and on the last, possibly partial, window)\n",
+        "        if (step + 1) % accum_steps == 0 or step + 1 == len(loader):\n",
+        "            if scaler is not None:\n",
+        "                scaler.unscale_(optimizer)\n",
+        "            # Gradient Clipping\n",
+        "            torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=0.1)\n",
+        "            if scaler is not None:\n",
+        "                scaler.step(optimizer)\n",
+        "                scaler.update()\n",
+        "            else:\n",
+        "                optimizer.step()\n",
+        "            optimizer.zero_grad(set_to_none=True)  # drop grads instead of memsetting them\n",
         "        \n",
         "        total_loss += loss.item()\n",
         "        pbar.set_postfix({'loss': loss.item()})\n",
@@ -66,10 +100,10 @@ try:
         "    total_loss = 0\n",
         "    with torch.no_grad():\n",
         "        for images, targets in tqdm(loader, desc=\"Validating DETR\"):\n",
-        "            images = list(img.to(device) for img in images)\n",
+        "            images = list(img.to(device, non_blocking=True) for img in images)\n",
         "            processed_targets = []\n",
         "            for t in targets:\n",
-        "                d = {k: v.to(device) for k, v in t.items()}\n",
+        "                d = {k: v.to(device, non_blocking=True) for k, v in t.items()}\n",
         "                processed_targets.append(d)\n",
         "            \n",
         "            outputs = model(pixel_values=torch.stack(images), labels=processed_targets)\n",
@@ -77,14 +111,27 @@ try:
         "            \n",
         "    return total_loss / len(loader)\n",
         "\n",
-        "optimizer = torch.optim.AdamW(detr_model.parameters(), lr=1e-4, weight_decay=1e-4)\n",
-        "scaler = GradScaler()\n",
+        "# channels_last lets cuDNN pick tensor-core kernels for the ResNet-50 backbone\n",
+        "detr_model = detr_model.to(memory_format=torch.channels_last)\n",
+        "# torch.compile is opt-in. DetrLoss's scipy Hungarian matcher forces graph breaks and the\n",
+        "# per-batch target counts vary, so use the default mode with dynamic shapes (reduce-overhead\n",
+        "# would re-record CUDA graphs for every new shape). detr_model itself stays unwrapped so its\n",
+        "# state_dict keys load straight into the API (no _orig_mod. prefix)\n",
+        "USE_TORCH_COMPILE = False\n",
+        "train_model = torch.compile(detr_model, dynamic=True) if USE_TORCH_COMPILE else detr_model\n",
+        "\n",
+        "# fused AdamW updates every parameter in one CUDA kernel (CUDA only, hence the flag)\n",
+        "optimizer = torch.optim.AdamW(detr_model.parameters(), lr=1e-4, weight_decay=1e-4, fused=torch.cuda.is_available())\n",
+        "scaler = None if USE_BF16 else GradScaler()\n",
         "\n",
-        "print(\"✅ DETR optimization routine (AMP + Grad Clipping + Collator) implemented.\")"
+        "print(\"✅ DETR optimization routine (AMP + Grad Clipping + Collator) implemented.\")\n",
+        "print(\"   Train with train_detr_epoch(train_model, train_loader, optimizer, scaler, DEVICE)\")"
     ]
     
     data['cells'][cell_index]['source'] = optimized_code
     
+    # Written with stdlib json on purpose: indent=1 is nbformat's layout (orjson only does 2),
+    # so re-running this only changes the one cell in the diff
     with open(notebook_path, 'w', encoding='utf-8') as f:
         json.dump(data, f, indent=1)
     
@@ -1,36 +1,85 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 import json
 
+try:
+    import aiohttp
+except ImportError:  # optional; without it the checks fan out over threads instead
+    aiohttp = None
+
 BASE_URL = "http://localhost:8000/api"
+TIMEOUT = 5  # seconds; a hung endpoint shouldn't hang the whole check
 
-def test_endpoint(endpoint):
-    url = f"{BASE_URL}{endpoint}"
+# Keep-alive connections instead of a new TCP handshake per request. requests.Session isn't
+# documented as thread-safe (shared cookie jar / adapter state), so each thread gets its own
+_local = threading.local()
+
+def _session():
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = _local.session = requests.Session()
+    return session
+
+ENDPOINTS = [
+    "/health",                                    # 1. Health check
+    "/evaluation/latest/metrics",                 # 2. Main metrics
+    "/evaluation/latest/pr-curve?model=yolov5",   # 3. PR Curve
+    "/evaluation/latest/per-class?model=yolov5",  # 4. Per-class metrics
+    "/evaluation/latest/stability?model=yolov5",  # 5. Stability metrics
+]
+
+def _report(url, data=None, error=None):
     print(f"Testing {url}...")
+    if error is not None:
+        print(f"❌ Failed: {error}")
+    else:
+        print(f"✅ Success - Keys: {list(data.keys()) if isinstance(data, dict) else len(data) if isinstance(data, list) else 'Value'}")
+
+def _fetch(endpoint):
+    """(url, data, error) for one endpoint; nothing printed, so concurrent calls don't interleave."""
+    url = f"{BASE_URL}{endpoint}"
     try:
-        response = requests.get(url)
+        response = _session().get(url, timeout=TIMEOUT)
         response.raise_for_status()
-        data = response.json()
-        print(f"✅ Success - Keys: {list(data.keys()) if isinstance(data, dict) else len(data) if isinstance(data, list) else 'Value'}")
-        return data
+        return url, response.json(), None
     except Exception as e:
-        print(f"❌ Failed: {e}")
-        return None
+        return url, None, e
+
+def test_endpoint(endpoint):
+    """Check one endpoint and print the outcome. Returns the decoded JSON, or None on failure."""
+    url, data, error = _fetch(endpoint)
+    _report(url, data, error)
+    return data
+
+async def _fetch_async(session, endpoint):
+    url = f"{BASE_URL}{endpoint}"
+    try:
+        async with session.get(url) as response:
+            response.raise_for_status()
+            return url, await response.json(), None
+    except Exception as e:
+        return url, None, e
+
+async def _run_async():
+    timeout = aiohttp.ClientTimeout(total=TIMEOUT)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        return await asyncio.gather(*[_fetch_async(session, ep) for ep in ENDPOINTS])
 
 def run_tests():
-    # 1. Health check
-    test_endpoint("/health")
-    
-    # 2. Main metrics
-    test_endpoint("/evaluation/latest/metrics")
-    
-    # 3. PR Curve
-    test_endpoint("/evaluation/latest/pr-curve?model=yolov5")
-    
-    # 4. Per-class metrics
-    test_endpoint("/evaluation/latest/per-class?model=yolov5")
-    
-    # 5. Stability metrics
-    test_endpoint("/evaluation/latest/stability?model=yolov5")
+    # The checks are independent, so they run concurrently: wall time is the slowest
+    # endpoint, not the sum. Results are printed in the original order afterwards.
+    if aiohttp is not None:
+        results = asyncio.run(_run_async())
+    else:
+        with ThreadPoolExecutor(max_workers=len(ENDPOINTS)) as pool:
+            results = list(pool.map(_fetch, ENDPOINTS))
+
+    for url, data, error in results:
+        _report(url, data, error)
+    return {url: data for url, data, _ in results}
 
 if __name__ == "__main__":
     run_tests()